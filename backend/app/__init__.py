@@ -1,4 +1,5 @@
 from contextlib import asynccontextmanager
+import asyncio
 from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,16 +7,25 @@ from fastapi.responses import FileResponse
 import os
 import re
 
-from app.browser import browser_manager
+from app.transport import sam
+from app.db import db
 from app.api.v1.endpoints import health
 from app.endpoints import router as endpoints_router
+from app.retention import retention_loop
+from app.workers import audio_executor
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await browser_manager.start()
+    db.load()
+    audio_executor.start()
+    await sam.start()
+    retention_task = asyncio.create_task(retention_loop())
     yield
-    await browser_manager.stop()
+    retention_task.cancel()
+    await sam.stop()
+    audio_executor.stop()
+    db.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -26,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Peaks-Frame-Rate", "X-Peaks-Samples-Per-Peak", "X-Peaks-Level", "X-Peaks-Levels"],
 )
 
 UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
@@ -1,9 +1,37 @@
 from fastapi import APIRouter
 
+from app.transport import sam
+from app.db import db
+from app.workers import audio_executor
+from app.prompt_cache import prompt_cache
+from app.scheduler import scheduler
+
 router = APIRouter()
 
 @router.get("/health")
 def health():
     return {"status": "ok"}
 
+@router.get("/health/db")
+def health_db():
+    return db.stats()
+
+@router.get("/health/audio")
+async def health_audio():
+    return audio_executor.stats()
+
+@router.get("/health/cache")
+async def health_cache():
+    return prompt_cache.stats()
+
+@router.get("/health/browser")
+async def health_browser():
+    return sam.manager.stats()
+
+@router.get("/health/transport")
+async def health_transport():
+    return sam.stats()
 
+@router.get("/health/scheduler")
+async def health_scheduler():
+    return scheduler.stats()
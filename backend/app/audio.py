@@ -1,14 +1,249 @@
 from pydub import AudioSegment
+from pydub.utils import mediainfo_json
 from pathlib import Path
+import array
+import csv
+import hashlib
+import math
+import mmap
 import os
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import wave
 
 MAX_CHUNK_DURATION_MS = 29000  # 29 seconds
 
-def get_audio_duration(file_path: str) -> float:
-    audio = AudioSegment.from_file(file_path)
-    return len(audio) / 1000.0  # seconds
+# Stream copy cuts at the first frame boundary after the target, so aim a
+# second short of the limit
+SEGMENT_TARGET_MS = MAX_CHUNK_DURATION_MS - 1000
+
+# Codecs split without re-encoding: codec -> (file extension, segment muxer)
+STREAM_COPY_FORMATS = {
+    "mp3": ("mp3", "mp3"),
+    "flac": ("flac", "flac"),
+    "pcm_s16le": ("wav", "wav"),
+    "pcm_s24le": ("wav", "wav"),
+    "pcm_f32le": ("wav", "wav"),
+}
+
+# Inputs at least this long (or of unknown length) that can't be stream
+# copied are decoded and split incrementally instead of loaded whole, so peak
+# memory stays around one chunk of PCM
+STREAMING_MIN_DURATION_S = int(os.environ.get("SAMANTHA_STREAMING_MIN_SECONDS", 600))
+
+def probe_audio(file_path: str) -> dict:
+    # Reads container/stream metadata with ffprobe; nothing is decoded
+    info = mediainfo_json(file_path)
+    fmt = info.get("format", {})
+    stream = next((s for s in info.get("streams", []) if s.get("codec_type") == "audio"), {})
+    duration = fmt.get("duration") or stream.get("duration")
+    return {
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "format": fmt.get("format_name"),
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+        "channels": stream.get("channels"),
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") not in (None, "N/A") else None,
+    }
+
+def _decode_pcm(file_path: str, frame_rate: int, channels: int) -> subprocess.Popen:
+    # ffmpeg decoding to signed 16-bit PCM on stdout
+    return subprocess.Popen([
+        AudioSegment.converter, "-v", "error",
+        "-i", file_path,
+        "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels),
+        "pipe:1",
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Chunks quieter than both thresholds are treated as silence and never sent
+# to SAM
+SILENCE_RMS_DBFS = float(os.environ.get("SAMANTHA_SILENCE_RMS_DBFS", -60))
+SILENCE_PEAK_DBFS = float(os.environ.get("SAMANTHA_SILENCE_PEAK_DBFS", -45))
+
+# Rate chunks are decoded at for the energy analysis
+ANALYSIS_FRAME_RATE = 16000
+
+_VOLUME_RE = re.compile(r"(mean|max)_volume: (-?[\d.]+|-inf) dB")
+
+def chunk_levels(file_path: str) -> dict:
+    # RMS and peak level in dBFS of the chunk mixed to mono, measured by
+    # ffmpeg's volumedetect filter; nothing is decoded into Python
+    result = subprocess.run([
+        AudioSegment.converter, "-v", "info", "-nostats",
+        "-i", file_path,
+        "-ac", "1", "-ar", str(ANALYSIS_FRAME_RATE), "-af", "volumedetect",
+        "-f", "null", "-",
+    ], capture_output=True, text=True, check=True)
+    levels = {name: float(value) for name, value in _VOLUME_RE.findall(result.stderr)}
+    # No audio at all reports nothing
+    return {
+        "rms_dbfs": levels.get("mean", -math.inf),
+        "peak_dbfs": levels.get("max", -math.inf),
+    }
+
+def analyze_chunk(file_path: str) -> dict:
+    """Content hash of a chunk and whether it is silent; one pool job per chunk."""
+    levels = chunk_levels(file_path)
+    return {
+        "content_hash": file_hash(file_path),
+        "silent": levels["rms_dbfs"] < SILENCE_RMS_DBFS and levels["peak_dbfs"] < SILENCE_PEAK_DBFS,
+    }
+
+def synthesize_silent_outputs(file_path: str, output_dir: str, params=None) -> dict:
+    """Write the SAM outputs of a silent chunk locally: silence and the chunk itself.
+
+    params are (channels, sample width, frame rate) to match the other
+    chunks' outputs; by default the chunk's own rate and channels at 16 bit.
+    """
+    if params is None:
+        info = probe_audio(file_path)
+        params = (info["channels"] or 2, 2, info["sample_rate"] or 44100)
+    channels, sample_width, frame_rate = params
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    
+    without_isolated = os.path.join(output_dir, "without_isolated.wav")
+    _convert_to_wav(file_path, without_isolated, params)
+    with wave.open(without_isolated, "rb") as w:
+        nframes = w.getnframes()
+    
+    isolated = os.path.join(output_dir, "isolated.wav")
+    # Zero is silence for signed PCM; 8-bit WAV is unsigned around 128
+    silence = (b"\x80" if sample_width == 1 else b"\x00") * (channels * sample_width)
+    with wave.open(isolated, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sample_width)
+        w.setframerate(frame_rate)
+        for start in range(0, nframes, STITCH_BLOCK_FRAMES):
+            w.writeframes(silence * min(STITCH_BLOCK_FRAMES, nframes - start))
+    
+    return {"isolated": isolated, "without_isolated": without_isolated}
+
+def split_audio(file_path: str, output_dir: str, info: dict | None = None) -> list[dict]:
+    if info is None:
+        info = probe_audio(file_path)
+    
+    # If audio is under 29s, no need to split (or decode)
+    duration = info["duration"]
+    if duration is not None and duration * 1000 <= MAX_CHUNK_DURATION_MS:
+        return [{
+            "chunk_index": 0,
+            "file_path": file_path,
+            "start_time": 0.0,
+            "end_time": duration
+        }]
+    
+    if info["codec"] in STREAM_COPY_FORMATS:
+        chunks = _split_stream_copy(file_path, output_dir, info["codec"])
+        if chunks is not None:
+            return chunks
+    
+    if duration is None or duration >= STREAMING_MIN_DURATION_S:
+        return _split_streaming(file_path, output_dir, info)
+    return _split_decoded(file_path, output_dir)
 
-def split_audio(file_path: str, output_dir: str) -> list[dict]:
+def _split_stream_copy(file_path: str, output_dir: str, codec: str) -> list[dict] | None:
+    # Cut the original stream at frame boundaries with ffmpeg's segment muxer,
+    # without decoding or re-encoding. Returns None if ffmpeg fails or a
+    # segment ends up too long, so the caller can fall back to transcoding.
+    extension, muxer = STREAM_COPY_FORMATS[codec]
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    segment_list = os.path.join(output_dir, "segments.csv")
+    
+    result = subprocess.run([
+        AudioSegment.converter, "-y", "-v", "error",
+        "-i", file_path,
+        "-map", "0:a:0",  # drop cover art and other non-audio streams
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_time", f"{SEGMENT_TARGET_MS / 1000:.3f}",
+        "-segment_format", muxer,
+        "-segment_list", segment_list,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        os.path.join(output_dir, f"chunk_%d.{extension}"),
+    ], capture_output=True)
+    
+    if result.returncode != 0 or not os.path.exists(segment_list):
+        print(f"Stream copy split failed for {file_path}, re-encoding: {result.stderr.decode(errors='replace')}")
+        return None
+    
+    chunks = []
+    with open(segment_list) as f:
+        for chunk_index, row in enumerate(csv.reader(f)):
+            filename, start_time, end_time = row[0], float(row[1]), float(row[2])
+            chunks.append({
+                "chunk_index": chunk_index,
+                "file_path": os.path.join(output_dir, filename),
+                "start_time": start_time,
+                "end_time": end_time
+            })
+    os.remove(segment_list)
+    
+    if not chunks or any((c["end_time"] - c["start_time"]) * 1000 > MAX_CHUNK_DURATION_MS for c in chunks):
+        print(f"Stream copy split of {file_path} produced an oversized segment, re-encoding")
+        for chunk in chunks:
+            if os.path.exists(chunk["file_path"]):
+                os.remove(chunk["file_path"])
+        return None
+    
+    return chunks
+
+def _split_streaming(file_path: str, output_dir: str, info: dict) -> list[dict]:
+    # One ffmpeg process decodes the whole input to PCM; each chunk's worth is
+    # read off its stdout and encoded to its own mp3 before the next is read
+    frame_rate = info["sample_rate"] or 44100
+    channels = info["channels"] or 2
+    frame_size = channels * 2
+    chunk_frames = frame_rate * MAX_CHUNK_DURATION_MS // 1000
+    
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    decoder = _decode_pcm(file_path, frame_rate, channels)
+    chunks = []
+    start_frame = 0
+    try:
+        while data := decoder.stdout.read(chunk_frames * frame_size):
+            chunk_index = len(chunks)
+            chunk_path = os.path.join(output_dir, f"chunk_{chunk_index}.mp3")
+            subprocess.run([
+                AudioSegment.converter, "-y", "-v", "error",
+                "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels),
+                "-i", "pipe:0",
+                "-f", "mp3", chunk_path,
+            ], input=data, check=True, capture_output=True)
+            
+            end_frame = start_frame + len(data) // frame_size
+            chunks.append({
+                "chunk_index": chunk_index,
+                "file_path": chunk_path,
+                "start_time": start_frame / frame_rate,
+                "end_time": end_frame / frame_rate
+            })
+            start_frame = end_frame
+    finally:
+        decoder.stdout.close()
+        returncode = decoder.wait()
+    
+    if returncode != 0 or not chunks:
+        raise RuntimeError(f"ffmpeg could not decode {file_path}")
+    
+    # Turned out to fit in one chunk after all; keep the original file
+    if len(chunks) == 1:
+        os.remove(chunks[0]["file_path"])
+        chunks[0]["file_path"] = file_path
+    
+    return chunks
+
+def _split_decoded(file_path: str, output_dir: str) -> list[dict]:
     audio = AudioSegment.from_file(file_path)
     duration_ms = len(audio)
     
@@ -43,15 +278,181 @@ def split_audio(file_path: str, output_dir: str) -> list[dict]:
     
     return chunks
 
-def combine_audio_files(file_paths: list[str], output_path: str, format: str = "wav"):
-    # Ensure output directory exists
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    
-    combined = AudioSegment.empty()
+# Raw PCM formats ffmpeg reads for each WAV sample width
+PCM_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+
+# Frames copied per read while stitching
+STITCH_BLOCK_FRAMES = 1 << 16
+
+def stitch_audio(file_paths: list[str], outputs: dict[str, str]):
+    """Concatenate chunk files into one output per format, e.g. {"wav": ..., "mp3": ...}.
+
+    The WAV output is preallocated at its final size and memory-mapped, and
+    each chunk's frames are copied into it block by block while the same
+    blocks are piped to one ffmpeg encoder per other format. Chunks are read
+    once; peak memory is a few blocks no matter how long the result is.
+    Chunks that aren't PCM WAVs with the first chunk's parameters are first
+    converted, one at a time, to a temporary WAV that matches.
+    """
+    for output_path in outputs.values():
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     
+    params = _stitch_params(file_paths)
+    with tempfile.TemporaryDirectory(dir=Path(next(iter(outputs.values()))).parent) as temp_dir:
+        sources = []
+        for i, file_path in enumerate(file_paths):
+            if wav_params(file_path) == params:
+                sources.append(file_path)
+            else:
+                converted = os.path.join(temp_dir, f"{i}.wav")
+                _convert_to_wav(file_path, converted, params)
+                sources.append(converted)
+        _stitch_wav(sources, outputs, params)
+
+def wav_params(file_path: str):
+    try:
+        with wave.open(file_path, "rb") as w:
+            return (w.getnchannels(), w.getsampwidth(), w.getframerate())
+    except (wave.Error, EOFError):
+        return None
+
+def _stitch_params(file_paths: list[str]):
+    for file_path in file_paths:
+        params = wav_params(file_path)
+        if params is not None:
+            return params
+    info = probe_audio(file_paths[0])
+    return (info["channels"] or 2, 2, info["sample_rate"] or 44100)
+
+def _convert_to_wav(file_path: str, output_path: str, params):
+    channels, sample_width, frame_rate = params
+    codec = "pcm_u8" if sample_width == 1 else f"pcm_{PCM_FORMATS[sample_width]}"
+    subprocess.run([
+        AudioSegment.converter, "-y", "-v", "error",
+        "-i", file_path,
+        "-acodec", codec, "-ar", str(frame_rate), "-ac", str(channels),
+        "-f", "wav", output_path,
+    ], check=True, capture_output=True)
+
+def _wav_header(channels: int, sample_width: int, frame_rate: int, data_size: int) -> bytes:
+    block_align = channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, frame_rate,
+                                frame_rate * block_align, block_align, sample_width * 8)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+def _stitch_wav(file_paths: list[str], outputs: dict[str, str], params):
+    channels, sample_width, frame_rate = params
+    frame_size = channels * sample_width
+    data_size = 0
     for file_path in file_paths:
-        audio = AudioSegment.from_file(file_path)
-        combined += audio
+        with wave.open(file_path, "rb") as w:
+            data_size += w.getnframes() * frame_size
+    
+    encoders = [
+        subprocess.Popen([
+            AudioSegment.converter, "-y", "-v", "error",
+            "-f", PCM_FORMATS[sample_width], "-ar", str(frame_rate), "-ac", str(channels),
+            "-i", "pipe:0",
+            "-f", format, output_path,
+        ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        for format, output_path in outputs.items()
+        if format != "wav"
+    ]
+    
+    wav_file = wav_map = None
+    if "wav" in outputs:
+        header = _wav_header(channels, sample_width, frame_rate, data_size)
+        wav_file = open(outputs["wav"], "w+b")
+        wav_file.write(header)
+        wav_file.truncate(len(header) + data_size)
+        if data_size:
+            wav_map = mmap.mmap(wav_file.fileno(), 0)
+        offset = len(header)
+    
+    try:
+        for file_path in file_paths:
+            with wave.open(file_path, "rb") as w:
+                while True:
+                    frames = w.readframes(STITCH_BLOCK_FRAMES)
+                    if not frames:
+                        break
+                    if wav_map is not None:
+                        wav_map[offset:offset + len(frames)] = frames
+                        offset += len(frames)
+                    for encoder in encoders:
+                        encoder.stdin.write(frames)
+    finally:
+        if wav_map is not None:
+            wav_map.flush()
+            wav_map.close()
+        if wav_file is not None:
+            wav_file.close()
+        for encoder in encoders:
+            encoder.stdin.close()
+        errors = [encoder.stderr.read().decode(errors="replace") for encoder in encoders
+                  if encoder.wait() != 0]
     
-    combined.export(output_path, format=format)
+    if errors:
+        raise RuntimeError(f"Encoding stitched audio failed: {errors[0]}")
 
+# Waveform peaks: min/max pairs of mono audio decoded at PEAKS_FRAME_RATE.
+# Level 0 has one pair per PEAKS_SAMPLES_PER_PEAK samples, every further
+# level halves the resolution, down to the first level with fewer than
+# PEAKS_MIN_PEAKS pairs
+PEAKS_FRAME_RATE = 8000
+PEAKS_SAMPLES_PER_PEAK = 128
+PEAKS_MIN_PEAKS = 512
+
+def peaks_path(peaks_dir: str, name: str, level: int) -> str:
+    return os.path.join(peaks_dir, f"{name}.{level}.peaks")
+
+def compute_peaks(file_path: str, peaks_dir: str, name: str) -> int:
+    """Write the peak levels of file_path to peaks_dir, returning the level count.
+
+    Each level is a file of little-endian int16 min, max pairs.
+    """
+    decoder = _decode_pcm(file_path, PEAKS_FRAME_RATE, 1)
+    peaks = array.array("h")
+    window = PEAKS_SAMPLES_PER_PEAK
+    
+    def add_peaks(data: bytes):
+        values = array.array("h", data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        for i in range(0, len(values), window):
+            samples = values[i:i + window]
+            peaks.append(min(samples))
+            peaks.append(max(samples))
+    
+    # Only whole windows are taken from each read so the pairs line up no
+    # matter how the pipe splits the stream
+    pending = b""
+    while block := decoder.stdout.read(1 << 20):
+        pending += block
+        usable = len(pending) - len(pending) % (window * 2)
+        add_peaks(pending[:usable])
+        pending = pending[usable:]
+    add_peaks(pending[:len(pending) - len(pending) % 2])
+    if decoder.wait() != 0:
+        raise RuntimeError(f"Decoding {file_path} for peaks failed")
+    
+    levels = [peaks]
+    while len(levels[-1]) // 4 >= PEAKS_MIN_PEAKS:
+        previous = levels[-1]
+        mins, maxes = previous[0::2], previous[1::2]
+        level = array.array("h")
+        for i in range(0, len(mins), 2):
+            level.append(min(mins[i:i + 2]))
+            level.append(max(maxes[i:i + 2]))
+        levels.append(level)
+    
+    os.makedirs(peaks_dir, exist_ok=True)
+    for i, level in enumerate(levels):
+        if sys.byteorder == "big":
+            level.byteswap()
+        with open(peaks_path(peaks_dir, name, i), "wb") as f:
+            f.write(level.tobytes())
+    return len(levels)
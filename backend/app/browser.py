@@ -1,23 +1,193 @@
-from playwright.async_api import async_playwright, Browser, Playwright
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+from contextlib import asynccontextmanager
+from collections import OrderedDict
 import asyncio
+import base64
+import json
 import os
 import re
+import time
+import urllib.parse
 from pathlib import Path
 
-SAM_URL = "https://aidemos.meta.com/segment-anything/editor/segment-audio"
+# Site hosting SAM; point it at a stand-in (sam_standin.py) to test locally
+SAM_BASE_URL = os.environ.get("SAMANTHA_SAM_BASE_URL", "https://aidemos.meta.com").rstrip("/")
+SAM_URL = f"{SAM_BASE_URL}/segment-anything/editor/segment-audio"
+SAM_GRAPHQL_URL = f"{SAM_BASE_URL}/api/graphql/"
 VIEWPORT = {"width": 1280, "height": 720}
 
+BROWSER_HEADLESS = os.environ.get("SAMANTHA_BROWSER_HEADLESS", "0") == "1"
+# "" for Playwright's bundled Chromium
+BROWSER_CHANNEL = os.environ.get("SAMANTHA_BROWSER_CHANNEL", "chrome")
+
+# Requests the automation doesn't need can be aborted: everything of these
+# resource types, and URLs matching these patterns (analytics, telemetry).
+# Audio (fetch/xhr/media) always goes through. Off by default: the page is
+# driven by fixed click coordinates, which missing fonts and images can
+# shift until this is checked against the live site
+BROWSER_BLOCK_REQUESTS = os.environ.get("SAMANTHA_BROWSER_BLOCK_REQUESTS", "0") == "1"
+BLOCKED_RESOURCE_TYPES = {"image", "font"}
+BLOCKED_URL_PATTERN = re.compile(
+    r"google-analytics\.com|googletagmanager\.com|doubleclick\.net|connect\.facebook\.net"
+    r"|facebook\.com/tr|/ajax/bz|/logging/|/falco/|sentry\.io|/pixel"
+)
+
+# Routed requests bypass the browser's HTTP cache, so script and stylesheet
+# bundles are kept here and shared by every context
+STATIC_RESOURCE_TYPES = {"script", "stylesheet"}
+STATIC_CACHE_MAX_BYTES = int(os.environ.get("SAMANTHA_BROWSER_STATIC_CACHE_BYTES", 64 * 1024 ** 2))
+
+# Fetched bodies come back decoded, so these no longer describe them
+STALE_BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+# Pages kept open on SAM with the consent dialog already accepted; this also
+# caps how many chunks are in the browser at once
+BROWSER_POOL_SIZE = int(os.environ.get("SAMANTHA_BROWSER_POOL_SIZE", 4))
+
+# Uses after which a page's context is closed and replaced with a fresh one
+PAGE_MAX_USES = int(os.environ.get("SAMANTHA_PAGE_MAX_USES", 20))
+
+PAGE_HEALTH_TIMEOUT_S = 5
+
+# Seconds a page that just uploaded a chunk stays parked on that media, so a
+# prompt for it can skip loading and decoding the media again
+PAGE_LINGER_S = float(os.environ.get("SAMANTHA_PAGE_LINGER_SECONDS", 60))
+
+# Readiness signals waited on instead of fixed sleeps. Their timeouts add
+# up to no more than the sleeps they replaced (2s + 3s around the consent
+# click, 5s for decoding), so a missed signal never costs more than those
+CONSENT_SELECTOR = 'button:has-text("Accept"), button:has-text("Agree"), button:has-text("Allow")'
+CONSENT_TIMEOUT_MS = 2000
+CONSENT_DISMISSED_TIMEOUT_MS = 3000
+UPLOAD_INPUT_SELECTOR = 'input[type="file"]'
+READY_TIMEOUT_MS = 5000
+DECODE_TIMEOUT_MS = 5000
+
+# Decoding is done once the waveform canvas has a size and no loading
+# indicator is left on the page
+DECODE_READY_JS = """() => {
+    const canvas = document.querySelector("canvas");
+    return !!canvas && canvas.width > 0 && canvas.height > 0
+        && !document.querySelector('[role="progressbar"], [aria-busy="true"]');
+}"""
+
+# Result audio is fetched from the URLs in SAM's GraphQL prompt response,
+# whose keys say which output each one is. The page has that response by
+# the time it shows the result, so without it the download menu is used
+# straight away; responses still being read get this long to finish
+SAM_RESULT_KEYS = {
+    "isolated": os.environ.get("SAMANTHA_SAM_ISOLATED_KEY", "isolated_url"),
+    "without_isolated": os.environ.get("SAMANTHA_SAM_WITHOUT_ISOLATED_KEY", "without_isolated_url"),
+}
+RESULT_URLS_GRACE_S = 1
+
+# Blob URLs only resolve inside the page that created them
+FETCH_BLOB_JS = """async (url) => {
+    const bytes = new Uint8Array(await (await fetch(url)).arrayBuffer());
+    let binary = "";
+    for (let i = 0; i < bytes.length; i += 0x8000) {
+        binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+    }
+    return btoa(binary);
+}"""
+
+
+def find_value(data, keys: set[str]):
+    # First string value under any of keys, anywhere in a GraphQL payload
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in keys and isinstance(value, str) and value:
+                return value
+        data = list(data.values())
+    if isinstance(data, list):
+        for item in data:
+            if (value := find_value(item, keys)) is not None:
+                return value
+    return None
+
+
+def write_output(save_path: str, content: bytes):
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    Path(save_path).write_bytes(content)
+
+
+def parse_graphql_payloads(text: str) -> list:
+    # SAM answers with newline-delimited JSON, sometimes behind a for(;;); guard
+    payloads = []
+    for line in text.removeprefix("for (;;);").splitlines():
+        if line.strip():
+            payloads.append(json.loads(line))
+    return payloads
+
+
+class PooledPage:
+    def __init__(self, context: BrowserContext, page: Page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        # Media loaded in the page, and whether to park it on that media
+        # rather than reset it when it's returned
+        self.media_id: str | None = None
+        self.linger = False
+
+
 class BrowserManager:
-    def __init__(self):
+    def __init__(
+        self,
+        pool_size: int = BROWSER_POOL_SIZE,
+        max_uses: int = PAGE_MAX_USES,
+        headless: bool = BROWSER_HEADLESS,
+        block_requests: bool = BROWSER_BLOCK_REQUESTS,
+    ):
         self._playwright: Playwright | None = None
         self._browser: Browser | None = None
+        self.pool_size = pool_size
+        self.max_uses = max_uses
+        self.headless = headless
+        self.block_requests = block_requests
+        self._static: OrderedDict[str, tuple[int, dict, bytes]] = OrderedDict()
+        self._static_bytes = 0
+        self._idle: list[PooledPage] = []
+        self._lingering: OrderedDict[str, PooledPage] = OrderedDict()
+        self._slots: asyncio.Semaphore | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            "created": 0,
+            "recycled": 0,
+            "unhealthy": 0,
+            "broken": 0,
+            "linger_hits": 0,
+            "linger_steals": 0,
+            "linger_expired": 0,
+            "checkouts": 0,
+            "total_checkout_wait_ms": 0.0,
+            "max_checkout_wait_ms": 0.0,
+            "blocked_requests": 0,
+            "static_hits": 0,
+            "static_misses": 0,
+            "outputs_captured": 0,
+            "outputs_downloaded": 0,
+        }
+        self._waits: dict[str, dict] = {}
     
     async def start(self):
         self._playwright = await async_playwright().start()
-        self._browser = await self._playwright.chromium.launch(headless=False, channel='chrome')
+        self._browser = await self._playwright.chromium.launch(headless=self.headless, channel=BROWSER_CHANNEL or None)
+        self._slots = asyncio.Semaphore(self.pool_size)
         print("Browser started")
+        self._spawn(self._fill())
     
     async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pooled in [*self._idle, *self._lingering.values()]:
+            await pooled.context.close()
+        self._idle.clear()
+        self._lingering.clear()
         if self._browser:
             await self._browser.close()
         if self._playwright:
@@ -30,118 +200,488 @@ class BrowserManager:
             raise RuntimeError("Browser not started")
         return self._browser
     
-    async def upload_chunk_to_sam(self, file_path: str) -> str:
-        context = await self.browser.new_context(viewport=VIEWPORT)
-        page = await context.new_page()
-        
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _wait_for(self, step: str, signal) -> bool:
+        """Await a readiness signal, returning whether it came (False if it
+        failed or timed out); the time spent is recorded per step."""
+        started = time.perf_counter()
         try:
-            await page.goto(SAM_URL, wait_until='networkidle')
-            
+            await signal
+            ready = True
+        except Exception:
+            ready = False
+        
+        waited_ms = (time.perf_counter() - started) * 1000
+        waits = self._waits.setdefault(step, {"count": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0})
+        waits["count"] += 1
+        waits["fallbacks"] += not ready
+        waits["total_ms"] += waited_ms
+        waits["max_ms"] = max(waits["max_ms"], waited_ms)
+        return ready
+    
+    async def _accept_consent(self, page: Page):
+        consent = page.locator(CONSENT_SELECTOR).first
+        
+        # wait for accept button and click it
+        if await self._wait_for("consent", consent.wait_for(state="visible", timeout=CONSENT_TIMEOUT_MS)):
+            await consent.click()
+            await self._wait_for("consent_dismissed", consent.wait_for(state="hidden", timeout=CONSENT_DISMISSED_TIMEOUT_MS))
+        else:
             viewport = page.viewport_size
             width = viewport["width"]
             height = viewport["height"]
-            
-            # wait for accept button and click it
-            await asyncio.sleep(2)  # wait for dialog to appear
             accept_cordsp = (0.5, 0.65)
             accept_cords = (width * accept_cordsp[0], height * accept_cordsp[1])
             await page.mouse.click(*accept_cords)
             
             # wait for page to be ready after accepting
             await asyncio.sleep(3)
+    
+    async def _route(self, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_URL_PATTERN.search(request.url):
+            self._stats["blocked_requests"] += 1
+            await route.abort()
+            return
+        if request.resource_type not in STATIC_RESOURCE_TYPES or request.method != "GET":
+            await route.continue_()
+            return
+        
+        cached = self._static.get(request.url)
+        if cached is not None:
+            self._static.move_to_end(request.url)
+            self._stats["static_hits"] += 1
+            status, headers, body = cached
+            await route.fulfill(status=status, headers=headers, body=body)
+            return
+        
+        self._stats["static_misses"] += 1
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            await route.continue_()
+            return
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in STALE_BODY_HEADERS}
+        if response.status == 200 and len(body) <= STATIC_CACHE_MAX_BYTES:
+            self._static[request.url] = (response.status, headers, body)
+            self._static_bytes += len(body)
+            while self._static_bytes > STATIC_CACHE_MAX_BYTES:
+                _, (_, _, evicted) = self._static.popitem(last=False)
+                self._static_bytes -= len(evicted)
+        await route.fulfill(response=response, headers=headers, body=body)
+    
+    async def _open_page(self) -> PooledPage:
+        context = await self.browser.new_context(viewport=VIEWPORT)
+        try:
+            if self.block_requests:
+                await context.route("**/*", self._route)
+            page = await context.new_page()
+            await page.goto(SAM_URL, wait_until='networkidle')
+            await self._accept_consent(page)
+        except BaseException:
+            await context.close()
+            raise
+        self._stats["created"] += 1
+        return PooledPage(context, page)
+    
+    async def _close(self, pooled: PooledPage):
+        self._size -= 1
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass
+    
+    async def _fill(self):
+        # Warm pages up to the pool size in the background
+        missing = self.pool_size - self._size
+        if missing <= 0:
+            return
+        self._size += missing
+        results = await asyncio.gather(*(self._open_page() for _ in range(missing)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                self._size -= 1
+                print(f"Warming browser page failed: {result!r}")
+            else:
+                self._idle.append(result)
+    
+    async def _healthy(self, pooled: PooledPage) -> bool:
+        if pooled.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(pooled.page.evaluate("document.readyState"), PAGE_HEALTH_TIMEOUT_S)
+            return True
+        except Exception:
+            return False
+    
+    async def _reset(self, pooled: PooledPage) -> bool:
+        try:
+            await pooled.page.goto(SAM_URL, wait_until='networkidle')
+        except Exception:
+            self._stats["unhealthy"] += 1
+            await self._close(pooled)
+            return False
+        pooled.media_id = None
+        return True
+    
+    async def _checkout(self, media_id: str | None = None) -> PooledPage:
+        requested = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        
+        try:
+            pooled = None
+            if media_id is not None and media_id in self._lingering:
+                candidate = self._lingering.pop(media_id)
+                if await self._healthy(candidate):
+                    self._stats["linger_hits"] += 1
+                    pooled = candidate
+                else:
+                    self._stats["unhealthy"] += 1
+                    await self._close(candidate)
+            while pooled is None and self._idle:
+                candidate = self._idle.pop()
+                if await self._healthy(candidate):
+                    pooled = candidate
+                    break
+                self._stats["unhealthy"] += 1
+                await self._close(candidate)
+            if pooled is None and self._lingering and self._size >= self.pool_size:
+                # Every page is busy or parked: take the longest-parked one
+                _, candidate = self._lingering.popitem(last=False)
+                self._stats["linger_steals"] += 1
+                if await self._reset(candidate):
+                    pooled = candidate
+            if pooled is None:
+                # Pool drained (or still warming): open a page for this caller
+                self._size += 1
+                try:
+                    pooled = await self._open_page()
+                except BaseException:
+                    self._size -= 1
+                    raise
+        except BaseException:
+            self._slots.release()
+            raise
+        
+        self._in_use += 1
+        wait_ms = (time.perf_counter() - requested) * 1000
+        self._stats["checkouts"] += 1
+        self._stats["total_checkout_wait_ms"] += wait_ms
+        self._stats["max_checkout_wait_ms"] = max(self._stats["max_checkout_wait_ms"], wait_ms)
+        return pooled
+    
+    async def _recycle(self, pooled: PooledPage, broken: bool):
+        # Reset the page to SAM's start page before it goes back to the pool,
+        # so the next checkout doesn't pay for the navigation
+        try:
+            pooled.uses += 1
+            if broken:
+                self._stats["broken"] += 1
+                await self._close(pooled)
+            elif pooled.uses >= self.max_uses or self._size > self.pool_size:
+                self._stats["recycled"] += 1
+                await self._close(pooled)
+            elif pooled.linger and pooled.media_id:
+                pooled.linger = False
+                replaced = self._lingering.pop(pooled.media_id, None)
+                if replaced is not None:
+                    await self._close(replaced)
+                self._lingering[pooled.media_id] = pooled
+                self._spawn(self._expire(pooled))
+            elif await self._reset(pooled):
+                self._idle.append(pooled)
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+        
+        if self._size < self.pool_size:
+            await self._fill()
+    
+    async def _expire(self, pooled: PooledPage):
+        media_id = pooled.media_id
+        await asyncio.sleep(PAGE_LINGER_S)
+        if self._lingering.get(media_id) is pooled:
+            del self._lingering[media_id]
+            self._stats["linger_expired"] += 1
+            if await self._reset(pooled):
+                self._idle.append(pooled)
+    
+    @asynccontextmanager
+    async def page(self, media_id: str | None = None):
+        """Check out a warm SAM page, preferring one parked on media_id; it
+        goes back to the pool afterwards, or is replaced if the caller failed
+        with it."""
+        pooled = await self._checkout(media_id)
+        try:
+            yield pooled
+        except BaseException:
+            self._spawn(self._recycle(pooled, broken=True))
+            raise
+        self._spawn(self._recycle(pooled, broken=False))
+    
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        checkouts = stats.pop("checkouts")
+        total_wait = stats.pop("total_checkout_wait_ms")
+        return {
+            "pool_size": self.pool_size,
+            "max_uses": self.max_uses,
+            "open": self._size,
+            "idle": len(self._idle),
+            "lingering": len(self._lingering),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "checkouts": checkouts,
+            "avg_checkout_wait_ms": total_wait / checkouts if checkouts else 0.0,
+            **stats,
+            "static_cache_entries": len(self._static),
+            "static_cache_bytes": self._static_bytes,
+            "waits": {
+                step: {
+                    "count": waits["count"],
+                    "fallbacks": waits["fallbacks"],
+                    "avg_ms": waits["total_ms"] / waits["count"],
+                    "max_ms": waits["max_ms"],
+                }
+                for step, waits in self._waits.items()
+            },
+        }
+    
+    async def harvest_session(self) -> dict:
+        """Cookies, request headers and form tokens of a live SAM session,
+        copied from a GraphQL request the page makes while loading."""
+        async with self.page() as pooled:
+            page = pooled.page
+            async with page.expect_request(
+                lambda r: r.url.startswith(SAM_GRAPHQL_URL) and r.method == "POST"
+                and "urlencoded" in (r.headers.get("content-type") or ""),
+                timeout=30000,
+            ) as request_info:
+                await page.reload(wait_until='networkidle')
+            request = await request_info.value
             
-            # upload file
-            upload_cords = (855, 300)
-            async with page.expect_file_chooser(timeout=5000) as fc_info:
-                await page.mouse.click(*upload_cords)
-            file_chooser = await fc_info.value
-            await file_chooser.set_files(file_path)
-            
-            # wait for URL to contain media_id
-            await page.wait_for_url("**/segment-audio/?media_id=*", timeout=60000)
-            
-            # extract media_id from URL
-            url = page.url
-            match = re.search(r"media_id=(\d+)", url)
-            if not match:
-                raise Exception("Failed to extract media_id from URL")
-            
-            sam_media_id = match.group(1)
+            # Per-query fields are left out; the rest identify the session
+            form = dict(urllib.parse.parse_qsl(request.post_data or ""))
+            for field in ("variables", "doc_id", "fb_api_caller_class", "fb_api_req_friendly_name", "server_timestamps", "__req"):
+                form.pop(field, None)
+            headers = {
+                name: value for name, value in (await request.all_headers()).items()
+                if name in ("user-agent", "accept-language", "origin", "referer", "x-fb-lsd", "x-asbd-id")
+            }
+            cookies = {cookie["name"]: cookie["value"] for cookie in await pooled.context.cookies(SAM_BASE_URL)}
+            return {"form": form, "headers": headers, "cookies": cookies, "harvested_at": time.time()}
+    
+    async def upload_chunk_to_sam(self, file_path: str) -> str:
+        async with self.page() as pooled:
+            sam_media_id = await self._upload(pooled, file_path)
+            # The page now shows the decoded media; keep it there for a
+            # while in case a prompt for it follows
+            pooled.linger = True
             return sam_media_id
-            
-        finally:
-            await context.close()
     
-    async def process_chunk_prompt(self, sam_media_id: str, prompt: str, output_dir: str, chunk_index: int) -> dict:
-        context = await self.browser.new_context(viewport=VIEWPORT)
-        page = await context.new_page()
+    async def upload_and_prompt(self, file_path: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> tuple[str, list | Exception]:
+        """Upload a chunk and run prompts on it on the same page, while the
+        media is still loaded.
         
+        Returns the media id and the prompts' outputs. If only the prompts
+        failed, the exception takes the place of the outputs, so the upload
+        isn't lost.
+        """
+        sam_media_id = None
         try:
+            async with self.page() as pooled:
+                sam_media_id = await self._upload(pooled, file_path)
+                return sam_media_id, await self._run_prompts(pooled, sam_media_id, prompts, output_dirs, chunk_index)
+        except Exception as e:
+            if sam_media_id is None:
+                raise
+            return sam_media_id, e
+    
+    async def _upload(self, pooled: PooledPage, file_path: str) -> str:
+        page = pooled.page
+        await self._wait_for("upload_ready", page.wait_for_selector(
+            UPLOAD_INPUT_SELECTOR, state="attached", timeout=READY_TIMEOUT_MS))
+        
+        # upload file
+        upload_cords = (855, 300)
+        async with page.expect_file_chooser(timeout=5000) as fc_info:
+            await page.mouse.click(*upload_cords)
+        file_chooser = await fc_info.value
+        await file_chooser.set_files(file_path)
+        
+        # SAM navigates to the media once the upload response is in;
+        # without it there is no media_id to return
+        if not await self._wait_for("upload_response", page.wait_for_url(
+                "**/segment-audio/?media_id=*", timeout=60000)):
+            raise Exception("Timed out waiting for SAM to accept the upload")
+        
+        # extract media_id from URL
+        url = page.url
+        match = re.search(r"media_id=(\d+)", url)
+        if not match:
+            raise Exception("Failed to extract media_id from URL")
+        
+        pooled.media_id = match.group(1)
+        return pooled.media_id
+    
+    async def process_chunk_prompts(self, sam_media_id: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> list[dict]:
+        """Run several prompts on one chunk in turn, loading the media once.
+        
+        Each prompt's outputs are saved under its own output_dir, fetched
+        from the result URLs SAM sent or, failing that, through the
+        download menu.
+        """
+        async with self.page(sam_media_id) as pooled:
+            return await self._run_prompts(pooled, sam_media_id, prompts, output_dirs, chunk_index)
+    
+    async def _run_prompts(self, pooled: PooledPage, sam_media_id: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> list[dict]:
+        page = pooled.page
+        
+        # consent was accepted when the page was warmed; a page that just
+        # uploaded this media already has it loaded
+        if pooled.media_id != sam_media_id:
             await page.goto(f"{SAM_URL}/?media_id={sam_media_id}", wait_until='networkidle')
-            
-            viewport = page.viewport_size
-            width = viewport["width"]
-            height = viewport["height"]
-            
-            # wait for accept dialog and click it
-            await asyncio.sleep(2)
-            accept_cordsp = (0.5, 0.65)
-            accept_cords = (width * accept_cordsp[0], height * accept_cordsp[1])
-            await page.mouse.click(*accept_cords)
-            
-            # wait for page to be ready
-            await asyncio.sleep(3)
-            
-            # wait for audio to load and decode
-            try:
-                await page.wait_for_selector("canvas", timeout=30000)
-                await asyncio.sleep(5)
-            except:
-                await asyncio.sleep(5)
-            
-            # click input box and type prompt
-            input_cords = (220, 255)
-            await page.mouse.click(*input_cords)
-            await asyncio.sleep(0.1)
-            
-            await page.keyboard.type(prompt)
-            await page.keyboard.press("Enter")
-            
-            # wait for processing to complete
-            await page.wait_for_selector("text=Add sound effects", timeout=120000)
-            
-            # create output dir for this chunk (ensure parent dirs exist)
+            pooled.media_id = sam_media_id
+        
+        # wait for audio to load and decode
+        await self._wait_for("canvas", page.wait_for_selector("canvas", timeout=30000))
+        await self._wait_for("decode", page.wait_for_function(DECODE_READY_JS, timeout=DECODE_TIMEOUT_MS))
+        
+        results = []
+        for prompt, output_dir in zip(prompts, output_dirs):
             chunk_output_dir = os.path.join(output_dir, f"chunk_{chunk_index}")
-            os.makedirs(chunk_output_dir, exist_ok=True)
-            
-            # download isolated and without_isolated files
-            download_button_cords = (1245, 52)
-            download_options = [
-                (856, 387, "without_isolated.wav"),
-                (856, 337, "isolated.wav"),
-            ]
-            
-            outputs = {}
-            for x, y, filename in download_options:
-                # open download dialog
-                await page.mouse.click(*download_button_cords)
+            on_response, result_urls = self._watch_result_urls()
+            page.on("response", on_response)
+            try:
+                # click input box and type prompt, replacing the previous one
+                input_cords = (220, 255)
+                await page.mouse.click(*input_cords)
                 await asyncio.sleep(0.1)
                 
-                # click download option
-                async with page.expect_download() as download_info:
-                    await page.mouse.click(x, y)
-                download = await download_info.value
-                save_path = os.path.join(chunk_output_dir, filename)
-                await download.save_as(save_path)
+                if results:
+                    await page.keyboard.press("ControlOrMeta+A")
+                    await page.keyboard.press("Backspace")
+                await page.keyboard.type(prompt)
+                await page.keyboard.press("Enter")
                 
-                key = filename.replace(".wav", "")
-                outputs[key] = save_path
-                await asyncio.sleep(0.1)
+                # wait for processing to complete; after the first prompt the
+                # previous result has to go away first, or the wait below
+                # would return on it
+                if results and not await self._wait_for("result_cleared", page.wait_for_selector(
+                        "text=Add sound effects", state="hidden", timeout=READY_TIMEOUT_MS)):
+                    raise Exception("SAM did not start on the prompt; previous result still shown")
+                await page.wait_for_selector("text=Add sound effects", timeout=120000)
+                
+                urls = await result_urls()
+            finally:
+                page.remove_listener("response", on_response)
             
-            return outputs
+            outputs = await self._capture_outputs(page, urls, chunk_output_dir) if urls else None
+            if outputs is None:
+                outputs = await self._download_outputs(page, chunk_output_dir)
+                self._stats["outputs_downloaded"] += 1
+            else:
+                self._stats["outputs_captured"] += 1
+            results.append(outputs)
+        
+        return results
+    
+    def _watch_result_urls(self):
+        # A page response handler picking the result URLs out of SAM's
+        # GraphQL responses, and a coroutine function returning them once
+        # the result shows (None if none came)
+        found = {}
+        reading = set()
+        closed = False
+        
+        async def read(response):
+            try:
+                payloads = parse_graphql_payloads(await response.text())
+            except Exception:
+                return
+            if closed or found:
+                return
+            urls = {output_type: find_value(payloads, {key}) for output_type, key in SAM_RESULT_KEYS.items()}
+            if all(urls.values()):
+                found.update(urls)
+        
+        def on_response(response):
+            if not closed and response.url.startswith(SAM_GRAPHQL_URL):
+                task = asyncio.ensure_future(read(response))
+                reading.add(task)
+                task.add_done_callback(reading.discard)
+        
+        async def result_urls() -> dict | None:
+            nonlocal closed
+            if reading:
+                await self._wait_for("result_urls", asyncio.wait_for(
+                    asyncio.gather(*reading, return_exceptions=True), RESULT_URLS_GRACE_S))
+            closed = True
+            return dict(found) or None
+        
+        return on_response, result_urls
+    
+    async def _capture_outputs(self, page: Page, urls: dict, chunk_output_dir: str) -> dict | None:
+        """Fetch the result URLs into chunk_output_dir, or None if that
+        fails and the download menu has to be used."""
+        async def fetch(url: str) -> bytes:
+            if url.startswith("blob:"):
+                return base64.b64decode(await page.evaluate(FETCH_BLOB_JS, url))
+            # Shares the page's cookies
+            response = await page.context.request.get(url)
+            if not response.ok:
+                raise Exception(f"Fetching SAM output failed with {response.status}")
+            return await response.body()
+        
+        outputs = {}
+        try:
+            # One at a time, so only one output is in memory
+            for output_type, url in urls.items():
+                save_path = os.path.join(chunk_output_dir, f"{output_type}.wav")
+                await asyncio.to_thread(write_output, save_path, await fetch(url))
+                outputs[output_type] = save_path
+        except Exception as e:
+            print(f"Fetching SAM outputs failed, downloading instead: {e}")
+            return None
+        return outputs
+    
+    async def _download_outputs(self, page: Page, chunk_output_dir: str) -> dict:
+        # create output dir for this chunk (ensure parent dirs exist)
+        os.makedirs(chunk_output_dir, exist_ok=True)
+        
+        # download isolated and without_isolated files
+        download_button_cords = (1245, 52)
+        download_options = [
+            (856, 387, "without_isolated.wav"),
+            (856, 337, "isolated.wav"),
+        ]
+        
+        outputs = {}
+        for x, y, filename in download_options:
+            # open download dialog
+            await page.mouse.click(*download_button_cords)
+            await asyncio.sleep(0.1)
             
-        finally:
-            await context.close()
-
+            # click download option
+            async with page.expect_download() as download_info:
+                await page.mouse.click(x, y)
+            download = await download_info.value
+            save_path = os.path.join(chunk_output_dir, filename)
+            await download.save_as(save_path)
+            
+            key = filename.replace(".wav", "")
+            outputs[key] = save_path
+            await asyncio.sleep(0.1)
+        
+        return outputs
 
 browser_manager = BrowserManager()
@@ -1,4 +1,12 @@
-from app.json_db import json_db
+import os
 
-# Use JSON database instead of Supabase
-db = json_db
+# Storage backend: "json" (data.json, single process) or "sqlite"
+# (data.sqlite3, safe to share between several uvicorn workers)
+DB_BACKEND = os.environ.get("SAMANTHA_DB_BACKEND", "json")
+
+if DB_BACKEND == "sqlite":
+    from app.sqlite_db import sqlite_db as db
+elif DB_BACKEND == "json":
+    from app.json_db import json_db as db
+else:
+    raise ValueError(f"Unknown SAMANTHA_DB_BACKEND: {DB_BACKEND!r}")
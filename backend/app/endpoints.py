@@ -1,14 +1,23 @@
 import uuid
 import asyncio
+import hashlib
 import traceback
 import os
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, Cookie, HTTPException
+from fastapi import APIRouter, UploadFile, Cookie, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 
-from app.browser import browser_manager
+from app.transport import sam
 from app.db import db
-from app.audio import split_audio, get_audio_duration, combine_audio_files
+from app.audio import (
+    split_audio, probe_audio, stitch_audio, analyze_chunk,
+    synthesize_silent_outputs, wav_params,
+    compute_peaks, peaks_path, PEAKS_FRAME_RATE, PEAKS_SAMPLES_PER_PEAK,
+)
+from app.workers import audio_executor
+from app.prompt_cache import prompt_cache, normalize_prompt, cache_key
+from app.scheduler import scheduler, INTERACTIVE, BULK
 
 router = APIRouter()
 
@@ -18,85 +27,228 @@ UPLOADS_DIR.mkdir(exist_ok=True)
 OUTPUTS_DIR.mkdir(exist_ok=True)
 
 
-async def upload_chunk_task(upload_id: str, chunk_data: dict):
+async def upload_chunk_task(upload_id: str, user_id: str, chunks: list[dict], prompt_job: dict | None = None):
+    # chunks all have the same content, so one SAM upload serves them all
+    chunk_indexes = [c["chunk_index"] for c in chunks]
     try:
-        sam_media_id = await browser_manager.upload_chunk_to_sam(chunk_data["file_path"])
+        async with scheduler.slot(user_id, upload_id, BULK):
+            if prompt_job is None:
+                sam_media_id = await sam.upload_chunk_to_sam(chunks[0]["file_path"])
+            else:
+                # Prompt right away on the page that uploaded the chunk,
+                # before another chunk's upload can take it over
+                sam_media_id, outputs = await sam.upload_and_prompt(
+                    chunks[0]["file_path"], [prompt_job["prompt"]],
+                    [str(OUTPUTS_DIR / prompt_job["output_id"])], chunks[0]["chunk_index"])
+                if isinstance(outputs, Exception):
+                    # The chunk is prompted again once the upload is done
+                    traceback.print_exception(outputs)
+                else:
+                    prompt_cache.put(cache_key(chunks[0], prompt_job["prompt"]), outputs[0])
+                    for chunk in chunks:
+                        prompt_job["outputs"][chunk["chunk_index"]] = outputs[0]
         
-        db.table("chunks").update({
+        await db.table("chunks").update({
             "sam_media_id": sam_media_id,
             "status": "complete"
-        }).eq("upload_id", upload_id).eq("chunk_index", chunk_data["chunk_index"]).execute()
+        }).eq("upload_id", upload_id).in_("chunk_index", chunk_indexes).aexecute()
         
     except Exception as e:
         traceback.print_exc()
-        db.table("chunks").update({
+        await db.table("chunks").update({
             "status": "failed",
             "error": str(e)
-        }).eq("upload_id", upload_id).eq("chunk_index", chunk_data["chunk_index"]).execute()
+        }).eq("upload_id", upload_id).in_("chunk_index", chunk_indexes).aexecute()
 
 
-async def run_upload_to_sam(upload_id: str, file_path: str):
+async def find_uploaded_chunk(content_hash: str) -> dict | None:
+    # Any earlier chunk with identical bytes that made it to SAM
+    for chunk in (await db.table("chunks").select("*").eq("content_hash", content_hash).aexecute()).data:
+        if chunk.get("sam_media_id"):
+            return chunk
+    return None
+
+
+async def reuse_upload(upload_id: str, content_hash: str) -> bool:
+    # A complete upload of the same file: copy its chunk rows, media ids and
+    # all, instead of splitting and uploading again
+    for source in (await db.table("uploads").select("*").eq("content_hash", content_hash).eq("status", "complete").aexecute()).data:
+        if source["id"] == upload_id:
+            continue
+        source_chunks = (await db.table("chunks").select("*").eq("upload_id", source["id"]).order("chunk_index").aexecute()).data
+        if not source_chunks or not all(c.get("sam_media_id") or c.get("silent") for c in source_chunks):
+            continue
+        
+        await db.table("chunks").insert([
+            {
+                "upload_id": upload_id,
+                "chunk_index": c["chunk_index"],
+                "start_time": c["start_time"],
+                "end_time": c["end_time"],
+                "content_hash": c.get("content_hash"),
+                "sam_media_id": c.get("sam_media_id"),
+                "silent": c.get("silent", False),
+                "file_path": c.get("file_path"),
+                "status": "complete",
+                "reused_from": source["id"],
+            }
+            for c in source_chunks
+        ]).aexecute()
+        await db.table("uploads").update({
+            "status": "complete",
+            "duration_seconds": source.get("duration_seconds"),
+            "reused_from": source["id"],
+        }).eq("id", upload_id).aexecute()
+        return True
+    return False
+
+
+async def store_peaks(table: str, row_id: str, peaks_dir: Path, file_paths: dict[str, str]):
+    # Waveform peaks for the player; a failure here leaves the audio usable
     try:
-        duration = get_audio_duration(file_path)
+        levels = await asyncio.gather(*(
+            audio_executor.run(compute_peaks, path, str(peaks_dir), track)
+            for track, path in file_paths.items()
+        ))
+        await db.table(table).update({
+            "peak_levels": dict(zip(file_paths, levels))
+        }).eq("id", row_id).aexecute()
+    except Exception:
+        traceback.print_exc()
+
+
+async def run_upload_to_sam(upload_id: str, user_id: str, file_path: str, content_hash: str, prompt_job: dict | None = None):
+    # prompt_job ({"output_id", "prompt", "outputs"}) has each uploaded chunk
+    # prompted as part of its upload; outputs collects them by chunk index
+    peaks_dir = UPLOADS_DIR / f"{upload_id}_peaks"
+    try:
+        if await reuse_upload(upload_id, content_hash):
+            await store_peaks("uploads", upload_id, peaks_dir, {"original": file_path})
+            return
+        
+        # Duration comes from container metadata; split_audio decodes the
+        # file at most once, and not at all when it fits in one chunk or can
+        # be cut with stream copy
+        info = await audio_executor.run(probe_audio, file_path)
         
         # Split audio into chunks
         chunk_dir = UPLOADS_DIR / f"{upload_id}_chunks"
-        chunks = split_audio(file_path, str(chunk_dir))
+        chunks = await audio_executor.run(split_audio, file_path, str(chunk_dir), info=info)
+        duration = info["duration"] if info["duration"] is not None else chunks[-1]["end_time"]
         
-        # Create chunk records in DB
-        for chunk in chunks:
-            db.table("chunks").insert({
+        # Chunks whose bytes SAM has already seen keep that media id, and
+        # silent chunks are never uploaded: prompts on them are answered
+        # locally. Each chunk is analyzed as its own job, so they spread over
+        # the whole audio pool
+        analyses = await asyncio.gather(*(audio_executor.run(analyze_chunk, chunk["file_path"]) for chunk in chunks))
+        rows = []
+        to_upload: dict[str, list[dict]] = {}
+        for chunk, analysis in zip(chunks, analyses):
+            chunk_hash, silent = analysis["content_hash"], analysis["silent"]
+            row = {
                 "upload_id": upload_id,
                 "chunk_index": chunk["chunk_index"],
                 "start_time": chunk["start_time"],
                 "end_time": chunk["end_time"],
+                "content_hash": chunk_hash,
+                "file_path": chunk["file_path"],
+                "silent": silent,
                 "status": "processing"
-            }).execute()
+            }
+            if silent:
+                row["status"] = "complete"
+            elif existing := await find_uploaded_chunk(chunk_hash):
+                row["sam_media_id"] = existing["sam_media_id"]
+                row["status"] = "complete"
+            else:
+                to_upload.setdefault(chunk_hash, []).append({**chunk, "content_hash": chunk_hash})
+            rows.append(row)
+        
+        # Create chunk records in DB
+        await db.table("chunks").insert(rows).aexecute()
         
-        # Upload all chunks in parallel
-        tasks = [upload_chunk_task(upload_id, chunk) for chunk in chunks]
-        await asyncio.gather(*tasks)
+        # Upload the remaining distinct chunks, as many at once as the
+        # scheduler allows, computing the waveform peaks meanwhile
+        tasks = [upload_chunk_task(upload_id, user_id, same_chunks, prompt_job) for same_chunks in to_upload.values()]
+        await asyncio.gather(store_peaks("uploads", upload_id, peaks_dir, {"original": file_path}), *tasks)
         
         # Check if all chunks succeeded
-        chunks_result = db.table("chunks").select("*").eq("upload_id", upload_id).execute()
+        chunks_result = await db.table("chunks").select("*").eq("upload_id", upload_id).aexecute()
         all_complete = all(c["status"] == "complete" for c in chunks_result.data)
         
         if all_complete:
-            db.table("uploads").update({
+            await db.table("uploads").update({
                 "status": "complete",
                 "duration_seconds": duration
-            }).eq("id", upload_id).execute()
+            }).eq("id", upload_id).aexecute()
         else:
-            db.table("uploads").update({
+            await db.table("uploads").update({
                 "status": "failed",
                 "error": "Some chunks failed to upload"
-            }).eq("id", upload_id).execute()
+            }).eq("id", upload_id).aexecute()
             
     except Exception as e:
         traceback.print_exc()
-        db.table("uploads").update({
+        await db.table("uploads").update({
             "status": "failed",
             "error": str(e)
-        }).eq("id", upload_id).execute()
+        }).eq("id", upload_id).aexecute()
+        await db.table("chunks").update({
+            "status": "failed",
+            "error": str(e)
+        }).eq("upload_id", upload_id).eq("status", "processing").aexecute()
+
+
+async def prompt_on_sam(job_id: str, user_id: str, chunk: dict, prompts: list[str], output_dirs: list[str]) -> list[dict]:
+    async with scheduler.slot(user_id, job_id, INTERACTIVE):
+        return await sam.process_chunk_prompts(
+            chunk["sam_media_id"], prompts, output_dirs, chunk["chunk_index"])
+
+
+async def process_chunk_task(output_ids: list[str], job_id: str, user_id: str, chunk: dict, prompts: list[str]) -> list:
+    # All prompts for this chunk run in one browser session; the result has
+    # each output's chunk result, or the exception it failed with
+    chunk_index = chunk["chunk_index"]
+    output_dirs = {}
+    for prompt, output_id in zip(prompts, output_ids):
+        output_dirs.setdefault(normalize_prompt(prompt), str(OUTPUTS_DIR / output_id))
+    
+    # Cache hits and shared runs don't take a scheduler slot
+    results = await prompt_cache.run_many(chunk, prompts, lambda missing: prompt_on_sam(
+        job_id, user_id, chunk, missing, [output_dirs[normalize_prompt(p)] for p in missing]))
+    
+    completed = [output_id for output_id, result in zip(output_ids, results) if not isinstance(result, Exception)]
+    if completed:
+        await db.table("output_chunks").update({
+            "status": "complete"
+        }).in_("output_id", completed).eq("chunk_index", chunk_index).aexecute()
+    
+    chunk_results = []
+    for output_id, result in zip(output_ids, results):
+        if isinstance(result, Exception):
+            traceback.print_exception(result)
+            await db.table("output_chunks").update({
+                "status": "failed",
+                "error": str(result)
+            }).eq("output_id", output_id).eq("chunk_index", chunk_index).aexecute()
+            chunk_results.append(result)
+        else:
+            chunk_results.append({
+                "chunk_index": chunk_index,
+                "outputs": result
+            })
+    return chunk_results
 
 
-async def process_chunk_task(output_id: str, chunk: dict, prompt: str):
+async def silent_chunk_task(output_id: str, chunk: dict, params) -> dict:
     try:
         chunk_index = chunk["chunk_index"]
-        sam_media_id = chunk["sam_media_id"]
-        
-        # Update chunk status to processing
-        db.table("output_chunks").update({
-            "status": "processing"
-        }).eq("output_id", output_id).eq("chunk_index", chunk_index).execute()
+        chunk_output_dir = str(OUTPUTS_DIR / output_id / f"chunk_{chunk_index}")
+        outputs = await audio_executor.run(synthesize_silent_outputs, chunk["file_path"], chunk_output_dir, params)
         
-        output_dir = str(OUTPUTS_DIR / output_id)
-        outputs = await browser_manager.process_chunk_prompt(sam_media_id, prompt, output_dir, chunk_index)
-        
-        # Update chunk status to complete
-        db.table("output_chunks").update({
+        await db.table("output_chunks").update({
             "status": "complete"
-        }).eq("output_id", output_id).eq("chunk_index", chunk_index).execute()
+        }).eq("output_id", output_id).eq("chunk_index", chunk_index).aexecute()
         
         return {
             "chunk_index": chunk_index,
@@ -104,79 +256,157 @@ async def process_chunk_task(output_id: str, chunk: dict, prompt: str):
         }
     except Exception as e:
         traceback.print_exc()
-        db.table("output_chunks").update({
+        await db.table("output_chunks").update({
             "status": "failed",
             "error": str(e)
-        }).eq("output_id", output_id).eq("chunk_index", chunk_index).execute()
+        }).eq("output_id", output_id).eq("chunk_index", chunk_index).aexecute()
         raise
 
 
-async def run_process_prompt(output_id: str, upload_id: str, prompt: str):
+async def finish_output(output_id: str, chunks: list[dict], chunk_results: list) -> bool:
+    # Whether the output completed; failures are recorded on its row
     try:
-        # Ensure outputs directory exists
-        OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
-        
-        # Get all chunks for this upload
-        chunks_result = db.table("chunks").select("*").eq("upload_id", upload_id).order("chunk_index").execute()
-        chunks = chunks_result.data
-        
-        # Create output_chunk records for tracking progress
-        for chunk in chunks:
-            db.table("output_chunks").insert({
-                "output_id": output_id,
-                "chunk_index": chunk["chunk_index"],
-                "status": "pending"
-            }).execute()
+        for result in chunk_results:
+            if isinstance(result, Exception):
+                raise result
         
-        # Process all chunks in parallel
-        tasks = [process_chunk_task(output_id, chunk, prompt) for chunk in chunks]
-        chunk_results = await asyncio.gather(*tasks)
+        # Silent chunks get silence as the isolated sound and themselves as
+        # the rest, in the same WAV format SAM returned for the others
+        params = wav_params(chunk_results[0]["outputs"]["isolated"]) if chunk_results else None
+        tasks = [silent_chunk_task(output_id, chunk, params) for chunk in chunks if chunk.get("silent")]
+        chunk_results = chunk_results + list(await asyncio.gather(*tasks))
         
         # Sort by chunk_index
         chunk_results.sort(key=lambda x: x["chunk_index"])
         
         output_dir = str(OUTPUTS_DIR / output_id)
         
-        # Combine outputs for each type in both WAV and MP3 formats
-        for output_type in ["isolated", "without_isolated"]:
-            file_paths = [result["outputs"][output_type] for result in chunk_results]
-            
-            # Generate WAV version
-            wav_path = os.path.join(output_dir, f"{output_type}.wav")
-            combine_audio_files(file_paths, wav_path, format="wav")
-            
-            # Generate MP3 version
-            mp3_path = os.path.join(output_dir, f"{output_type}.mp3")
-            combine_audio_files(file_paths, mp3_path, format="mp3")
+        # Combine outputs for each type into WAV and MP3 in one pass, both
+        # types at once on the audio pool
+        await asyncio.gather(*(
+            audio_executor.run(stitch_audio, [result["outputs"][output_type] for result in chunk_results], {
+                "wav": os.path.join(output_dir, f"{output_type}.wav"),
+                "mp3": os.path.join(output_dir, f"{output_type}.mp3"),
+            })
+            for output_type in ["isolated", "without_isolated"]
+        ))
+        
+        await store_peaks("outputs", output_id, OUTPUTS_DIR / output_id / "peaks", {
+            output_type: os.path.join(output_dir, f"{output_type}.wav")
+            for output_type in ["isolated", "without_isolated"]
+        })
         
-        db.table("outputs").update({
+        await db.table("outputs").update({
             "status": "complete",
             "isolated_url": f"/outputs/{output_id}/isolated.wav",
             "without_isolated_url": f"/outputs/{output_id}/without_isolated.wav",
             "isolated_mp3_url": f"/outputs/{output_id}/isolated.mp3",
             "without_isolated_mp3_url": f"/outputs/{output_id}/without_isolated.mp3",
-        }).eq("id", output_id).execute()
+        }).eq("id", output_id).aexecute()
+        return True
+        
+    except Exception as e:
+        traceback.print_exc()
+        await db.table("outputs").update({
+            "status": "failed",
+            "error": str(e)
+        }).eq("id", output_id).aexecute()
+        return False
+
+
+async def run_process_prompts(output_ids: list[str], upload_id: str, user_id: str, prompts: list[str], job_id: str | None = None, prompted: dict[int, dict] | None = None):
+    # One output per prompt; job_id groups them in the scheduler. prompted
+    # has chunk outputs of a single prompt already got during the upload
+    job_id = job_id or output_ids[0]
+    prompted = prompted or {}
+    try:
+        # Ensure outputs directory exists
+        OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
         
-        # Update upload with latest prompt
-        db.table("uploads").update({
-            "last_prompt": prompt
-        }).eq("id", upload_id).execute()
+        # Get all chunks for this upload
+        chunks_result = await db.table("chunks").select("*").eq("upload_id", upload_id).order("chunk_index").aexecute()
+        chunks = chunks_result.data
+        
+        # Create output_chunk records for tracking progress
+        await db.table("output_chunks").insert([
+            {
+                "output_id": output_id,
+                "chunk_index": chunk["chunk_index"],
+                "status": "complete" if chunk["chunk_index"] in prompted else "pending"
+            }
+            for output_id in output_ids
+            for chunk in chunks
+        ]).aexecute()
+        
+        # All chunks start at once, so move them to processing in one write
+        await db.table("output_chunks").update({
+            "status": "processing"
+        }).in_("output_id", output_ids).eq("status", "pending").aexecute()
+        
+        # Process all chunks with sound, as many at once as the scheduler
+        # allows, each loading its media once for every prompt
+        tasks = [
+            process_chunk_task(output_ids, job_id, user_id, chunk, prompts)
+            for chunk in chunks
+            if not chunk.get("silent") and chunk["chunk_index"] not in prompted
+        ]
+        per_chunk = await asyncio.gather(*tasks)
+        per_chunk += [[{"chunk_index": index, "outputs": outputs}] for index, outputs in prompted.items()]
+        
+        finished = await asyncio.gather(*(
+            finish_output(output_id, chunks, [results[i] for results in per_chunk])
+            for i, output_id in enumerate(output_ids)
+        ))
+        
+        # Update upload with the latest prompt that worked
+        succeeded = [prompt for prompt, ok in zip(prompts, finished) if ok]
+        if succeeded:
+            await db.table("uploads").update({
+                "last_prompt": succeeded[-1]
+            }).eq("id", upload_id).aexecute()
         
     except Exception as e:
         traceback.print_exc()
-        db.table("outputs").update({
+        await db.table("outputs").update({
             "status": "failed",
             "error": str(e)
-        }).eq("id", output_id).execute()
+        }).in_("id", output_ids).aexecute()
+
+
+async def run_process_prompt(output_id: str, upload_id: str, user_id: str, prompt: str):
+    await run_process_prompts([output_id], upload_id, user_id, [prompt])
+
+
+async def run_upload_and_process(upload_id: str, user_id: str, file_path: str, content_hash: str, output_id: str, prompt: str):
+    # Each chunk is prompted on the page that uploaded it, in the same
+    # scheduler slot; chunks that weren't uploaded (reused, silent) or whose
+    # prompt failed are processed afterwards
+    prompt_job = {"output_id": output_id, "prompt": prompt, "outputs": {}}
+    await run_upload_to_sam(upload_id, user_id, file_path, content_hash, prompt_job)
+    
+    upload = (await db.table("uploads").select("*").eq("id", upload_id).aexecute()).data[0]
+    if upload["status"] == "complete":
+        await run_process_prompts([output_id], upload_id, user_id, [prompt], prompted=prompt_job["outputs"])
+    else:
+        await db.table("outputs").update({
+            "status": "failed",
+            "error": upload.get("error") or "Upload failed"
+        }).eq("id", output_id).aexecute()
 
 
 class ProcessRequest(BaseModel):
     upload_id: str
-    prompt: str
+    prompt: str | None = None
+    # Batch: one output per prompt, sharing each chunk's page load
+    prompts: list[str] | None = None
 
 
 @router.post("/upload")
-async def upload(file: UploadFile, user_id: str | None = Cookie(default=None)):
+async def upload(
+    file: UploadFile,
+    prompt: str | None = Form(default=None),
+    user_id: str | None = Cookie(default=None),
+):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id cookie required")
     
@@ -188,6 +418,7 @@ async def upload(file: UploadFile, user_id: str | None = Cookie(default=None)):
     
     content = await file.read()
     file_path.write_bytes(content)
+    content_hash = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
     
     # Store original filename (without extension for display)
     filename = file.filename or "Untitled"
@@ -195,36 +426,57 @@ async def upload(file: UploadFile, user_id: str | None = Cookie(default=None)):
     if "." in filename:
         filename = ".".join(filename.split(".")[:-1])
     
-    db.table("uploads").insert({
+    await db.table("uploads").insert({
         "id": upload_id,
         "user_id": user_id,
         "filename": filename,
         "status": "processing",
-    }).execute()
+        "content_hash": content_hash,
+    }).aexecute()
+    
+    if not prompt:
+        asyncio.create_task(run_upload_to_sam(upload_id, user_id, str(file_path), content_hash))
+        return {"upload_id": upload_id}
+    
+    # Upload and process in one job
+    output_id = str(uuid.uuid4())
+    await db.table("outputs").insert({
+        "id": output_id,
+        "upload_id": upload_id,
+        "user_id": user_id,
+        "prompt": prompt,
+        "status": "processing",
+    }).aexecute()
     
-    asyncio.create_task(run_upload_to_sam(upload_id, str(file_path)))
+    asyncio.create_task(run_upload_and_process(upload_id, user_id, str(file_path), content_hash, output_id, prompt))
     
-    return {"upload_id": upload_id}
+    return {"upload_id": upload_id, "output_id": output_id}
 
 
 @router.get("/status/upload/{upload_id}")
 async def get_upload(upload_id: str):
-    result = db.table("uploads").select("*").eq("id", upload_id).execute()
+    result = await db.table("uploads").select("*").eq("id", upload_id).aexecute()
     if not result.data:
         return {"status": "not_found"}
     
     upload = result.data[0]
     
-    # Get chunk status
-    chunks_result = db.table("chunks").select("*").eq("upload_id", upload_id).execute()
-    chunks = chunks_result.data if chunks_result.data else []
-    completed_chunks = sum(1 for c in chunks if c["status"] == "complete")
+    # Get chunk status, from the summary retention leaves once the rows are gone
+    summary = upload.get("chunk_summary")
+    if summary is None:
+        chunks_result = await db.table("chunks").select("*").eq("upload_id", upload_id).aexecute()
+        chunks = chunks_result.data if chunks_result.data else []
+        summary = {
+            "chunks": len(chunks),
+            "completed_chunks": sum(1 for c in chunks if c["status"] == "complete"),
+        }
     
     return {
         "status": upload["status"],
         "error": upload.get("error"),
-        "chunks": len(chunks),
-        "completed_chunks": completed_chunks,
+        "chunks": summary["chunks"],
+        "completed_chunks": summary["completed_chunks"],
+        "queue_position": scheduler.queue_position(upload_id),
         "duration_seconds": upload.get("duration_seconds"),
         "filename": upload.get("filename", "Untitled"),
         "last_prompt": upload.get("last_prompt")
@@ -236,7 +488,7 @@ async def process(req: ProcessRequest, user_id: str | None = Cookie(default=None
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id cookie required")
     
-    upload_result = db.table("uploads").select("*").eq("id", req.upload_id).execute()
+    upload_result = await db.table("uploads").select("*").eq("id", req.upload_id).aexecute()
     if not upload_result.data:
         raise HTTPException(status_code=404, detail="Upload not found")
     
@@ -244,38 +496,66 @@ async def process(req: ProcessRequest, user_id: str | None = Cookie(default=None
     if upload["status"] != "complete":
         raise HTTPException(status_code=400, detail="Upload not complete")
     
+    if req.prompts:
+        batch_id = str(uuid.uuid4())
+        output_ids = [str(uuid.uuid4()) for _ in req.prompts]
+        await db.table("outputs").insert([
+            {
+                "id": output_id,
+                "upload_id": req.upload_id,
+                "user_id": user_id,
+                "prompt": prompt,
+                "batch_id": batch_id,
+                "status": "processing",
+            }
+            for output_id, prompt in zip(output_ids, req.prompts)
+        ]).aexecute()
+        
+        asyncio.create_task(run_process_prompts(output_ids, req.upload_id, user_id, req.prompts, batch_id))
+        
+        return {"output_ids": output_ids}
+    
+    if not req.prompt:
+        raise HTTPException(status_code=400, detail="prompt or prompts required")
+    
     output_id = str(uuid.uuid4())
-    db.table("outputs").insert({
+    await db.table("outputs").insert({
         "id": output_id,
         "upload_id": req.upload_id,
         "user_id": user_id,
         "prompt": req.prompt,
         "status": "processing",
-    }).execute()
+    }).aexecute()
     
-    asyncio.create_task(run_process_prompt(output_id, req.upload_id, req.prompt))
+    asyncio.create_task(run_process_prompt(output_id, req.upload_id, user_id, req.prompt))
     
     return {"output_id": output_id}
 
 
 @router.get("/status/output/{output_id}")
 async def get_output(output_id: str):
-    result = db.table("outputs").select("*").eq("id", output_id).execute()
+    result = await db.table("outputs").select("*").eq("id", output_id).aexecute()
     if not result.data:
         return {"status": "not_found"}
     
     output = result.data[0]
     
-    # Get chunk progress
-    chunks_result = db.table("output_chunks").select("*").eq("output_id", output_id).execute()
-    chunks = chunks_result.data if chunks_result.data else []
-    completed_chunks = sum(1 for c in chunks if c["status"] == "complete")
+    # Get chunk progress, from the summary retention leaves once the rows are gone
+    summary = output.get("chunk_summary")
+    if summary is None:
+        chunks_result = await db.table("output_chunks").select("*").eq("output_id", output_id).aexecute()
+        chunks = chunks_result.data if chunks_result.data else []
+        summary = {
+            "chunks": len(chunks),
+            "completed_chunks": sum(1 for c in chunks if c["status"] == "complete"),
+        }
     
     response = {
         "status": output["status"],
         "error": output.get("error"),
-        "chunks": len(chunks),
-        "completed_chunks": completed_chunks,
+        "chunks": summary["chunks"],
+        "completed_chunks": summary["completed_chunks"],
+        "queue_position": scheduler.queue_position(output.get("batch_id") or output_id),
         "upload_id": output.get("upload_id"),
         "prompt": output.get("prompt"),
     }
@@ -287,50 +567,112 @@ async def get_output(output_id: str):
             "isolated_mp3": output["isolated_mp3_url"],
             "without_isolated_mp3": output["without_isolated_mp3_url"],
         }
+        for track in output.get("peak_levels") or {}:
+            response["outputs"][f"{track}_peaks"] = f"/peaks/{output_id}?track={track}"
     
     return response
 
 
-@router.get("/library")
-async def get_library(user_id: str | None = Cookie(default=None)):
-    if not user_id:
-        raise HTTPException(status_code=400, detail="user_id cookie required")
+@router.get("/peaks/{id}")
+async def get_peaks(
+    request: Request,
+    id: str,
+    track: str | None = None,
+    level: int | None = Query(default=None, ge=0),
+):
+    # Waveform peaks of an upload ("original") or an output ("isolated",
+    # "without_isolated"); level 0 is the finest, the default the coarsest
+    if row := (await db.table("uploads").select("*").eq("id", id).aexecute()).data:
+        peaks_dir = UPLOADS_DIR / f"{id}_peaks"
+        track = track or "original"
+    elif row := (await db.table("outputs").select("*").eq("id", id).aexecute()).data:
+        peaks_dir = OUTPUTS_DIR / id / "peaks"
+        track = track or "isolated"
+    else:
+        raise HTTPException(status_code=404, detail="Not found")
     
-    # Get all completed uploads for this user
-    uploads_result = db.table("uploads").select("*").eq("user_id", user_id).execute()
+    levels = (row[0].get("peak_levels") or {}).get(track)
+    if not levels:
+        raise HTTPException(status_code=404, detail="Peaks not available")
+    level = min(levels - 1 if level is None else level, levels - 1)
     
-    # Filter to only completed uploads
-    completed_uploads = [
-        u for u in uploads_result.data
-        if u.get("status") == "complete"
-    ]
+    path = peaks_path(str(peaks_dir), track, level)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Peaks not available")
     
-    # For each upload, get all completed outputs
-    uploads_with_outputs = []
-    for upload in completed_uploads:
-        outputs_result = db.table("outputs").select("*").eq("upload_id", upload["id"]).execute()
-        completed_outputs = [
-            {
-                "id": o["id"],
-                "prompt": o.get("prompt", ""),
-                "created_at": o.get("created_at", "")
-            }
-            for o in outputs_result.data
-            if o.get("status") == "complete"
-        ]
-        
-        # Sort outputs by created_at descending (most recent first)
-        completed_outputs.sort(key=lambda x: x["created_at"], reverse=True)
-        
-        uploads_with_outputs.append({
+    # Peak files never change once written, so clients can keep them
+    headers = {
+        "ETag": f'"{id}-{track}-{level}-{stat.st_size}-{stat.st_mtime_ns}"',
+        "Cache-Control": "public, max-age=86400",
+        "X-Peaks-Frame-Rate": str(PEAKS_FRAME_RATE),
+        "X-Peaks-Samples-Per-Peak": str(PEAKS_SAMPLES_PER_PEAK << level),
+        "X-Peaks-Level": str(level),
+        "X-Peaks-Levels": str(levels),
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/octet-stream", headers=headers)
+
+
+def build_library(uploads: list[dict], outputs_by_upload: dict[str, list[dict]]) -> list[dict]:
+    # uploads and each outputs list are already sorted most recent first
+    return [
+        {
             "id": upload["id"],
             "filename": upload.get("filename", "Untitled"),
             "created_at": upload.get("created_at", ""),
             "duration_seconds": upload.get("duration_seconds"),
-            "outputs": completed_outputs
-        })
+            "outputs": [
+                {
+                    "id": o["id"],
+                    "prompt": o.get("prompt", ""),
+                    "created_at": o.get("created_at", "")
+                }
+                for o in outputs_by_upload.get(upload["id"], [])
+            ]
+        }
+        for upload in uploads
+    ]
+
+
+@router.get("/library")
+async def get_library(
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=500),
+    user_id: str | None = Cookie(default=None),
+):
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id cookie required")
+    
+    # Completed uploads for this user, most recent first, ties broken by id.
+    # The cursor is "created_at|id" of the last upload on the previous page
+    # (a bare created_at from older clients still works)
+    uploads_query = (db.table("uploads").select("*").eq("user_id", user_id).eq("status", "complete")
+        .order("created_at", desc=True).order("id", desc=True))
+    if cursor:
+        created_at, _, last_id = cursor.partition("|")
+        if last_id:
+            uploads_query = uploads_query.lt(("created_at", "id"), (created_at, last_id))
+        else:
+            uploads_query = uploads_query.lt("created_at", created_at)
+    if limit:
+        # One extra row tells us whether there is another page
+        uploads_query = uploads_query.limit(limit + 1)
+    uploads = (await uploads_query.aexecute()).data
+    
+    next_cursor = None
+    if limit and len(uploads) > limit:
+        uploads = uploads[:limit]
+        next_cursor = f"{uploads[-1]['created_at']}|{uploads[-1]['id']}"
     
-    # Sort uploads by created_at descending (most recent first)
-    uploads_with_outputs.sort(key=lambda x: x["created_at"], reverse=True)
+    # Completed outputs for every upload on this page in one query
+    outputs_by_upload = (await db.table("outputs").select("*")
+        .in_("upload_id", [u["id"] for u in uploads])
+        .eq("status", "complete")
+        .order("created_at", desc=True)
+        .group_by("upload_id")
+        .aexecute()).data
     
-    return {"uploads": uploads_with_outputs}
+    return {"uploads": build_library(uploads, outputs_by_upload), "next_cursor": next_cursor}
@@ -3,41 +3,55 @@ import os
 from pathlib import Path
 from typing import Any
 from datetime import datetime
+import asyncio
+import itertools
 import threading
+import time
+from concurrent.futures import Future
+
+from app.query import Database
+from app.schema import TABLES, INDEXES
 
 DB_FILE = Path(__file__).parent.parent / "data.json"
-_lock = threading.Lock()
+JOURNAL_FILE = DB_FILE.with_suffix(".journal")
+
+# Fold the journal back into data.json once it holds this many entries
+SNAPSHOT_EVERY = 1000
+
+# How long the writer waits for more mutations before committing a batch
+COMMIT_WINDOW = 0.005
+
 
 def _read_db():
-    default_data = {"uploads": [], "chunks": [], "outputs": [], "output_chunks": []}
-    
+    default_data = {table: [] for table in TABLES}
+
     if not DB_FILE.exists():
         return default_data
-    
+
     try:
         with open(DB_FILE, "r") as f:
             content = f.read().strip()
-            
+
             # Handle empty file
             if not content:
                 print(f"Warning: {DB_FILE} is empty. Using default data structure.")
                 return default_data
-            
+
             # Parse JSON
             data = json.loads(content)
-            
+
             # Handle non-dict JSON (e.g., array, null, string)
             if not isinstance(data, dict):
                 print(f"Warning: {DB_FILE} contains non-object data. Using default data structure.")
                 return default_data
-            
+
             # Ensure all required tables exist
-            for table in ["uploads", "chunks", "outputs", "output_chunks"]:
+            for table in TABLES:
                 if table not in data:
                     data[table] = []
-            
+
             return data
-            
+
     except json.JSONDecodeError as e:
         print(f"Error: {DB_FILE} contains invalid JSON: {e}. Using default data structure.")
         return default_data
@@ -45,19 +59,22 @@ def _read_db():
         print(f"Error reading {DB_FILE}: {e}. Using default data structure.")
         return default_data
 
+
 def _write_db(data):
     temp_file = DB_FILE.with_suffix('.tmp')
     try:
         # Ensure the directory exists
         DB_FILE.parent.mkdir(parents=True, exist_ok=True)
-        
+
         # Write atomically by writing to a temp file first
         with open(temp_file, "w") as f:
             json.dump(data, f, indent=2)
-        
+            f.flush()
+            os.fsync(f.fileno())
+
         # Rename to actual file (atomic on most systems)
         temp_file.replace(DB_FILE)
-        
+
     except Exception as e:
         print(f"Error writing to {DB_FILE}: {e}")
         # Clean up temp file if it exists
@@ -65,101 +82,421 @@ def _write_db(data):
             temp_file.unlink()
         raise
 
-class MockResponse:
-    def __init__(self, data):
-        self.data = data
-
-class Table:
-    def __init__(self, name):
-        self.name = name
-        self._filters = []
-        self._order_field = None
-        self._insert_record = None
-    
-    def insert(self, record):
-        self._insert_record = record
-        return self
-    
-    def execute(self):
-        if self._insert_record is not None:
-            with _lock:
-                db = _read_db()
-                if "created_at" not in self._insert_record:
-                    self._insert_record["created_at"] = datetime.utcnow().isoformat()
-                db[self.name].append(self._insert_record)
-                _write_db(db)
-            return MockResponse([self._insert_record])
-        return MockResponse([])
-    
-    def update(self, updates):
-        return TableUpdate(self.name, self._filters, updates)
-    
-    def select(self, fields="*"):
-        return TableSelect(self.name, fields, self._filters, self._order_field)
-    
-    def eq(self, field, value):
-        new_table = Table(self.name)
-        new_table._filters = self._filters + [(field, value)]
-        return new_table
-    
-    def order(self, field):
-        new_table = Table(self.name)
-        new_table._filters = self._filters
-        new_table._order_field = field
-        return new_table
-
-class TableUpdate:
-    def __init__(self, table_name, filters, updates):
-        self.table_name = table_name
-        self.filters = filters
-        self.updates = updates
-    
-    def eq(self, field, value):
-        self.filters.append((field, value))
-        return self
-    
-    def execute(self):
-        with _lock:
-            db = _read_db()
-            for record in db[self.table_name]:
-                if all(record.get(k) == v for k, v in self.filters):
-                    record.update(self.updates)
-            _write_db(db)
-        return MockResponse([])
-
-class TableSelect:
-    def __init__(self, table_name, fields, filters, order_field):
-        self.table_name = table_name
-        self.fields = fields
-        self.filters = filters
-        self.order_field = order_field
-    
-    def eq(self, field, value):
-        self.filters.append((field, value))
-        return self
-    
-    def order(self, field):
-        self.order_field = field
-        return self
-    
-    def execute(self):
-        with _lock:
-            db = _read_db()
-            results = db[self.table_name]
-            
-            # Apply filters
-            for field, value in self.filters:
-                results = [r for r in results if r.get(field) == value]
-            
-            # Apply ordering
-            if self.order_field:
-                results = sorted(results, key=lambda x: x.get(self.order_field, ""))
-            
-            return MockResponse(results)
-
-class JsonDB:
-    def table(self, name):
-        return Table(name)
-
-json_db = JsonDB()
 
+def _matches(record, filters):
+    for field, op, value in filters:
+        if isinstance(field, (tuple, list)):
+            # Row comparison; journal replay turns the tuples into lists
+            row = tuple(record.get(f) for f in field)
+            if op == "lt" and not (None not in row and row < tuple(value)):
+                return False
+            continue
+        if op == "eq" and record.get(field) != value:
+            return False
+        if op == "in" and record.get(field) not in value:
+            return False
+        if op == "lt" and not (record.get(field) is not None and record.get(field) < value):
+            return False
+    return True
+
+
+class MemTable:
+    """Rows of one table keyed by insertion order, plus its hash indexes."""
+
+    def __init__(self, rows):
+        self._rows: dict[int, dict] = {}
+        self._next_rowid = 0
+        # fields -> key tuple -> {rowid: record}
+        self._indexes: dict[tuple, dict[tuple, dict[int, dict]]] = {}
+        for record in rows:
+            self.add(record)
+
+    def rows(self):
+        return list(self._rows.values())
+
+    def create_index(self, fields):
+        fields = tuple(fields)
+        if fields in self._indexes:
+            return
+        index = {}
+        for rowid, record in self._rows.items():
+            self._index_add(fields, index, rowid, record)
+        self._indexes[fields] = index
+
+    def _index_add(self, fields, index, rowid, record):
+        key = tuple(record.get(f) for f in fields)
+        try:
+            index.setdefault(key, {})[rowid] = record
+        except TypeError:
+            # Unhashable values can't be indexed; such rows are only found
+            # through filters that don't use this index
+            pass
+
+    def _index_remove(self, fields, index, rowid, record):
+        key = tuple(record.get(f) for f in fields)
+        try:
+            bucket = index.get(key)
+        except TypeError:
+            return
+        if bucket is not None:
+            bucket.pop(rowid, None)
+            if not bucket:
+                del index[key]
+
+    def add(self, record):
+        rowid = self._next_rowid
+        self._next_rowid += 1
+        self._rows[rowid] = record
+        for fields, index in self._indexes.items():
+            self._index_add(fields, index, rowid, record)
+
+    def find(self, filters) -> list[tuple[int, dict]]:
+        # Values each filtered field may take; the first filter on a field wins,
+        # _matches() below enforces the rest
+        allowed = {}
+        for field, op, value in filters:
+            if op == "eq":
+                allowed.setdefault(field, [value])
+            elif op == "in":
+                allowed.setdefault(field, list(value))
+
+        best = None
+        for fields in self._indexes:
+            if set(fields) <= allowed.keys() and (best is None or len(fields) > len(best)):
+                best = fields
+
+        if best is None:
+            candidates = self._rows.items()
+        else:
+            index = self._indexes[best]
+            bucket = {}
+            try:
+                for key in itertools.product(*(allowed[f] for f in best)):
+                    bucket.update(index.get(key, {}))
+            except TypeError:
+                bucket = self._rows
+            # Buckets lose table order when rows are re-indexed after an update
+            candidates = sorted(bucket.items(), key=lambda item: item[0])
+
+        return [(rowid, r) for rowid, r in candidates if _matches(r, filters)]
+
+    def update(self, filters, updates) -> list[dict]:
+        matched = self.find(filters)
+        touched = [(fields, index) for fields, index in self._indexes.items()
+                   if any(f in updates for f in fields)]
+        for rowid, record in matched:
+            for fields, index in touched:
+                self._index_remove(fields, index, rowid, record)
+            record.update(updates)
+            for fields, index in touched:
+                self._index_add(fields, index, rowid, record)
+        return [record for _, record in matched]
+
+    def delete(self, filters) -> list[dict]:
+        matched = self.find(filters)
+        for rowid, record in matched:
+            for fields, index in self._indexes.items():
+                self._index_remove(fields, index, rowid, record)
+            del self._rows[rowid]
+        return [record for _, record in matched]
+
+
+class JsonStore:
+    """Keeps every table in memory and logs mutations to an append-only journal.
+
+    data.json is only read once, on first use. Each insert/update/delete is
+    applied to the in-memory rows straight away, so reads never touch the
+    disk, and its journal line is handed to a background writer thread. The writer waits
+    COMMIT_WINDOW for more entries to arrive, appends the whole batch to
+    data.journal and fsyncs once. Every SNAPSHOT_EVERY entries it writes the
+    tables back to data.json and truncates the journal. Journal entries carry a
+    sequence number and the snapshot records the last one it contains, so a
+    crash between writing the snapshot and truncating the journal never
+    replays an entry twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables: dict[str, MemTable] | None = None
+        self._seq = 0
+        self._journal_entries = 0
+        self._journal = None
+
+        # Entries waiting for the writer, and the future resolved once they
+        # are durable
+        self._pending: list[tuple[str, float]] = []
+        self._pending_commit = Future()
+        self._wakeup = threading.Condition(self._lock)
+        self._writer: threading.Thread | None = None
+        self._stopping = False
+        self._stats = {
+            "commits": 0,
+            "entries": 0,
+            "max_batch_size": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+            "snapshots": 0,
+        }
+
+    def _ensure_loaded(self):
+        if self._tables is not None:
+            return
+
+        data = _read_db()
+        self._seq = data.pop("_seq", 0)
+        self._tables = {name: MemTable(rows) for name, rows in data.items() if isinstance(rows, list)}
+        for name, index_list in INDEXES.items():
+            for fields in index_list:
+                self._table(name).create_index(fields)
+
+        replayed = self._replay_journal()
+        self._journal = open(JOURNAL_FILE, "a")
+        if replayed:
+            print(f"Replayed {replayed} journal entries from {JOURNAL_FILE}")
+            self._snapshot()
+
+        self._stopping = False
+        self._writer = threading.Thread(target=self._write_loop, name="json-db-writer", daemon=True)
+        self._writer.start()
+
+    def _replay_journal(self) -> int:
+        if not JOURNAL_FILE.exists():
+            return 0
+
+        replayed = 0
+        with open(JOURNAL_FILE, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    print(f"Warning: skipping unreadable entry in {JOURNAL_FILE}")
+                    continue
+                if entry["seq"] <= self._seq:
+                    continue
+                self._apply(entry)
+                self._seq = entry["seq"]
+                replayed += 1
+        return replayed
+
+    def _table(self, name) -> MemTable:
+        if name not in self._tables:
+            self._tables[name] = MemTable([])
+        return self._tables[name]
+
+    def _apply(self, entry):
+        table = self._table(entry["table"])
+        if entry["op"] == "insert":
+            for record in entry["records"]:
+                table.add(dict(record))
+        elif entry["op"] == "update":
+            filters = [tuple(f) for f in entry["filters"]]
+            return table.update(filters, entry["updates"])
+        elif entry["op"] == "delete":
+            filters = [tuple(f) for f in entry["filters"]]
+            return table.delete(filters)
+
+    def _log(self, entry) -> Future:
+        # Serialize now: the rows in the entry keep changing after we return
+        self._seq += 1
+        entry["seq"] = self._seq
+        self._pending.append((json.dumps(entry), time.monotonic()))
+        self._wakeup.notify()
+        return self._pending_commit
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopping:
+                    self._wakeup.wait()
+                if not self._pending and self._stopping:
+                    return
+
+            # Let concurrent writers join this commit
+            if not self._stopping:
+                time.sleep(COMMIT_WINDOW)
+
+            with self._lock:
+                batch, self._pending = self._pending, []
+                commit, self._pending_commit = self._pending_commit, Future()
+
+            try:
+                self._reopen_journal()
+                self._journal.write("".join(line + "\n" for line, _ in batch))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            except Exception as e:
+                print(f"Error writing to {JOURNAL_FILE}: {e}")
+                commit.set_exception(e)
+                continue
+
+            committed_at = time.monotonic()
+            commit_ms = (committed_at - batch[0][1]) * 1000
+            self._stats["commits"] += 1
+            self._stats["entries"] += len(batch)
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+            self._stats["last_commit_ms"] = commit_ms
+            self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], commit_ms)
+            self._stats["total_commit_ms"] += commit_ms
+            commit.set_result(None)
+
+            self._journal_entries += len(batch)
+            if self._journal_entries >= SNAPSHOT_EVERY:
+                try:
+                    self._snapshot()
+                except Exception as e:
+                    # The journal still holds every entry, so nothing is lost;
+                    # the snapshot is retried after the next batch
+                    print(f"Error writing snapshot to {DB_FILE}: {e}")
+                    self._reopen_journal()
+
+    def _snapshot(self):
+        # Copy under the lock, serialize and write outside it
+        with self._lock:
+            seq = self._seq
+            tables = {name: [dict(r) for r in table.rows()] for name, table in self._tables.items()}
+        _write_db({"_seq": seq, **tables})
+        self._journal.close()
+        # Truncate only after the snapshot holding these entries is on disk
+        self._journal = open(JOURNAL_FILE, "w")
+        self._journal_entries = 0
+        self._stats["snapshots"] += 1
+
+    def _reopen_journal(self):
+        # After a failed snapshot the journal may be closed; without it every
+        # later commit would fail
+        if not self._journal.closed:
+            return
+        try:
+            self._journal = open(JOURNAL_FILE, "a")
+        except Exception as e:
+            print(f"Error reopening {JOURNAL_FILE}: {e}")
+
+    def load(self):
+        with self._lock:
+            self._ensure_loaded()
+
+    def create_index(self, table_name, fields):
+        with self._lock:
+            self._ensure_loaded()
+            self._table(table_name).create_index(fields)
+
+    def _stop_writer(self):
+        with self._lock:
+            if self._writer is None:
+                return
+            self._stopping = True
+            self._wakeup.notify()
+        self._writer.join()
+        self._writer = None
+
+    def compact(self):
+        with self._lock:
+            self._ensure_loaded()
+        # The writer owns the journal file, so pause it while we swap files
+        self._stop_writer()
+        self._snapshot()
+        with self._lock:
+            self._stopping = False
+            self._writer = threading.Thread(target=self._write_loop, name="json-db-writer", daemon=True)
+            self._writer.start()
+
+    def close(self):
+        if self._tables is None:
+            return
+        self._stop_writer()
+        self._snapshot()
+        with self._lock:
+            self._journal.close()
+            self._journal = None
+            self._tables = None
+
+    def dump(self) -> dict[str, list]:
+        with self._lock:
+            self._ensure_loaded()
+            return {name: [dict(r) for r in table.rows()] for name, table in self._tables.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"backend": "json", **self._stats}
+            stats["pending"] = len(self._pending)
+        total_commit_ms = stats.pop("total_commit_ms")
+        commits = stats["commits"]
+        stats["avg_batch_size"] = stats["entries"] / commits if commits else 0.0
+        stats["avg_commit_ms"] = total_commit_ms / commits if commits else 0.0
+        return stats
+
+    def insert(self, table_name, records):
+        return self._insert(table_name, records)[0]
+
+    async def ainsert(self, table_name, records):
+        records, commit = self._insert(table_name, records)
+        await asyncio.wrap_future(commit)
+        return records
+
+    def update(self, table_name, filters, updates):
+        return self._update(table_name, filters, updates)[0]
+
+    async def aupdate(self, table_name, filters, updates):
+        updated, commit = self._update(table_name, filters, updates)
+        await asyncio.wrap_future(commit)
+        return updated
+
+    def delete(self, table_name, filters):
+        return self._delete(table_name, filters)[0]
+
+    async def adelete(self, table_name, filters):
+        deleted, commit = self._delete(table_name, filters)
+        await asyncio.wrap_future(commit)
+        return deleted
+
+    def _insert(self, table_name, records):
+        with self._lock:
+            self._ensure_loaded()
+            created_at = datetime.utcnow().isoformat()
+            for record in records:
+                if "created_at" not in record:
+                    record["created_at"] = created_at
+            entry = {"op": "insert", "table": table_name, "records": records}
+            self._apply(entry)
+            commit = self._log(entry)
+        return records, commit
+
+    def _update(self, table_name, filters, updates):
+        with self._lock:
+            self._ensure_loaded()
+            entry = {"op": "update", "table": table_name, "filters": filters, "updates": updates}
+            updated = [dict(r) for r in self._apply(entry)]
+            commit = self._log(entry)
+        return updated, commit
+
+    def _delete(self, table_name, filters):
+        with self._lock:
+            self._ensure_loaded()
+            entry = {"op": "delete", "table": table_name, "filters": filters}
+            deleted = self._apply(entry)
+            commit = self._log(entry)
+        return deleted, commit
+
+    def select(self, table_name, filters, order=None, limit=None):
+        with self._lock:
+            self._ensure_loaded()
+            results = [r for _, r in self._table(table_name).find(filters)]
+
+        # Apply ordering; sorts are stable, so sorting by the last key first
+        # leaves the earlier keys deciding
+        for field, desc in reversed(order or []):
+            results = sorted(results, key=lambda x: x.get(field, ""), reverse=desc)
+
+        if limit is not None:
+            results = results[:limit]
+
+        return [dict(r) for r in results]
+
+    async def aselect(self, table_name, filters, order=None, limit=None):
+        # Served from memory; nothing to wait for
+        return self.select(table_name, filters, order, limit)
+
+
+json_db = Database(JsonStore())
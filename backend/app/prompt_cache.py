@@ -0,0 +1,160 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+# Limits on cached (chunk, prompt) results; the size is that of the
+# referenced isolated/without_isolated files
+CACHE_MAX_ENTRIES = int(os.environ.get("SAMANTHA_PROMPT_CACHE_ENTRIES", 4096))
+CACHE_MAX_BYTES = int(os.environ.get("SAMANTHA_PROMPT_CACHE_BYTES", 4 * 1024 ** 3))
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+def cache_key(chunk: dict, prompt: str) -> tuple[str, str]:
+    # Chunks uploaded before content hashing fall back to their SAM media id
+    content = chunk.get("content_hash") or f"media:{chunk['sam_media_id']}"
+    return content, normalize_prompt(prompt)
+
+
+class PromptCache:
+    """LRU cache of SAM results per (chunk content, prompt), plus single-flight.
+
+    Entries point at the isolated/without_isolated files an earlier output
+    already downloaded, so a hit costs nothing but the stitch. While a key is
+    being computed, identical requests await the same future instead of
+    driving SAM again.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[dict, int]] = OrderedDict()
+        self._bytes = 0
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "evictions": 0}
+
+    def get(self, key) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        outputs, size = entry
+        if not all(os.path.exists(path) for path in outputs.values()):
+            # The output holding these files was deleted (e.g. by retention)
+            del self._entries[key]
+            self._bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return outputs
+
+    def put(self, key, outputs: dict):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        size = sum(os.path.getsize(path) for path in outputs.values())
+        self._entries[key] = (outputs, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    async def run(self, chunk: dict, prompt: str, compute) -> dict:
+        """Return the outputs for chunk/prompt, calling compute() only if nobody has."""
+        key = cache_key(chunk, prompt)
+
+        cached = self.get(key)
+        if cached is not None:
+            self._stats["hits"] += 1
+            return cached
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._stats["shared"] += 1
+            # Shielded so one waiter being cancelled doesn't cancel the rest
+            return await asyncio.shield(in_flight)
+
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting when it fails; don't warn about that
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        try:
+            outputs = await compute()
+            self.put(key, outputs)
+            future.set_result(outputs)
+            return outputs
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def run_many(self, chunk: dict, prompts: list[str], compute) -> list:
+        """run() for several prompts on one chunk.
+
+        compute(prompts) is called once with only the prompts nobody has
+        computed yet and returns their outputs in order. The result has the
+        outputs for each prompt, or the exception it failed with.
+        """
+        keys = [cache_key(chunk, prompt) for prompt in prompts]
+        results = {}
+        shared = {}
+        missing = {}
+        for key, prompt in zip(keys, prompts):
+            if key in results or key in shared or key in missing:
+                continue
+            cached = self.get(key)
+            if cached is not None:
+                self._stats["hits"] += 1
+                results[key] = cached
+            elif key in self._in_flight:
+                self._stats["shared"] += 1
+                shared[key] = self._in_flight[key]
+            else:
+                self._stats["misses"] += 1
+                missing[key] = prompt
+
+        futures = {}
+        for key in missing:
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._in_flight[key] = futures[key] = future
+        if missing:
+            try:
+                computed = await compute(list(missing.values()))
+                for key, outputs in zip(missing, computed):
+                    self.put(key, outputs)
+                    futures[key].set_result(outputs)
+                    results[key] = outputs
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                for key in missing:
+                    results[key] = e
+            finally:
+                for key in missing:
+                    del self._in_flight[key]
+
+        for key, future in shared.items():
+            try:
+                results[key] = await asyncio.shield(future)
+            except Exception as e:
+                results[key] = e
+        return [results[key] for key in keys]
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "in_flight": len(self._in_flight),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+
+prompt_cache = PromptCache()
@@ -0,0 +1,188 @@
+# Supabase-style query builders shared by the storage backends. A backend
+# ("store") implements insert/update/select and their async counterparts;
+# see JsonStore and SqliteStore.
+
+
+class MockResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+# execute() runs the query on the calling thread; aexecute() never blocks the
+# event loop and, for writes, returns once the change is durable
+
+class Table:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self._filters = []
+        self._order = []
+        self._insert_records = None
+
+    def insert(self, records):
+        """Insert one record, or a list of records written as a single entry."""
+        self._insert_records = records if isinstance(records, list) else [records]
+        return self
+
+    def execute(self):
+        if self._insert_records is not None:
+            return MockResponse(self.store.insert(self.name, self._insert_records))
+        return MockResponse([])
+
+    async def aexecute(self):
+        if self._insert_records is not None:
+            return MockResponse(await self.store.ainsert(self.name, self._insert_records))
+        return MockResponse([])
+
+    def update(self, updates):
+        return TableUpdate(self.store, self.name, self._filters, updates)
+
+    def delete(self):
+        return TableDelete(self.store, self.name, self._filters)
+
+    def select(self, fields="*"):
+        return TableSelect(self.store, self.name, fields, self._filters, self._order)
+
+    def eq(self, field, value):
+        new_table = Table(self.store, self.name)
+        new_table._filters = self._filters + [(field, "eq", value)]
+        return new_table
+
+    def in_(self, field, values):
+        new_table = Table(self.store, self.name)
+        new_table._filters = self._filters + [(field, "in", list(values))]
+        return new_table
+
+    def lt(self, field, value):
+        """field < value; with a tuple of fields and one of values, compares
+        them as rows (for keyset pagination)."""
+        new_table = Table(self.store, self.name)
+        new_table._filters = self._filters + [(field, "lt", value)]
+        return new_table
+
+    def order(self, field, desc=False):
+        """Sort by field; further order() calls break ties."""
+        new_table = Table(self.store, self.name)
+        new_table._filters = self._filters
+        new_table._order = self._order + [(field, desc)]
+        return new_table
+
+class TableUpdate:
+    def __init__(self, store, table_name, filters, updates):
+        self.store = store
+        self.table_name = table_name
+        self.filters = list(filters)
+        self.updates = updates
+
+    def eq(self, field, value):
+        self.filters.append((field, "eq", value))
+        return self
+
+    def in_(self, field, values):
+        self.filters.append((field, "in", list(values)))
+        return self
+
+    def lt(self, field, value):
+        self.filters.append((field, "lt", value))
+        return self
+
+    def execute(self):
+        return MockResponse(self.store.update(self.table_name, self.filters, self.updates))
+
+    async def aexecute(self):
+        return MockResponse(await self.store.aupdate(self.table_name, self.filters, self.updates))
+
+class TableDelete:
+    def __init__(self, store, table_name, filters):
+        self.store = store
+        self.table_name = table_name
+        self.filters = list(filters)
+
+    def eq(self, field, value):
+        self.filters.append((field, "eq", value))
+        return self
+
+    def in_(self, field, values):
+        self.filters.append((field, "in", list(values)))
+        return self
+
+    def lt(self, field, value):
+        self.filters.append((field, "lt", value))
+        return self
+
+    def execute(self):
+        return MockResponse(self.store.delete(self.table_name, self.filters))
+
+    async def aexecute(self):
+        return MockResponse(await self.store.adelete(self.table_name, self.filters))
+
+class TableSelect:
+    def __init__(self, store, table_name, fields, filters, order):
+        self.store = store
+        self.table_name = table_name
+        self.fields = fields
+        self.filters = list(filters)
+        self.order_by = list(order)
+        self.limit_count = None
+        self.group_field = None
+
+    def eq(self, field, value):
+        self.filters.append((field, "eq", value))
+        return self
+
+    def in_(self, field, values):
+        self.filters.append((field, "in", list(values)))
+        return self
+
+    def lt(self, field, value):
+        self.filters.append((field, "lt", value))
+        return self
+
+    def order(self, field, desc=False):
+        self.order_by.append((field, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def group_by(self, field):
+        """Return the rows as {value of field: [rows]} instead of a list."""
+        self.group_field = field
+        return self
+
+    def _response(self, rows):
+        if self.group_field is None:
+            return MockResponse(rows)
+        groups = {}
+        for row in rows:
+            groups.setdefault(row.get(self.group_field), []).append(row)
+        return MockResponse(groups)
+
+    def execute(self):
+        return self._response(self.store.select(self.table_name, self.filters, self.order_by, self.limit_count))
+
+    async def aexecute(self):
+        return self._response(await self.store.aselect(self.table_name, self.filters, self.order_by, self.limit_count))
+
+class Database:
+    def __init__(self, store):
+        self.store = store
+
+    def table(self, name):
+        return Table(self.store, name)
+
+    def load(self):
+        self.store.load()
+
+    def create_index(self, table_name, *fields):
+        self.store.create_index(table_name, fields)
+
+    def compact(self):
+        self.store.compact()
+
+    def close(self):
+        self.store.close()
+
+    def stats(self):
+        return self.store.stats()
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import shutil
+import traceback
+from datetime import datetime, timedelta
+
+from app.db import db
+from app.endpoints import UPLOADS_DIR, OUTPUTS_DIR
+
+# Failed uploads/outputs (rows and files) are kept this long for debugging
+FAILED_TTL_SECONDS = int(os.environ.get("SAMANTHA_FAILED_TTL_SECONDS", 7 * 24 * 3600))
+
+# How often the background retention pass runs
+RETENTION_INTERVAL_SECONDS = int(os.environ.get("SAMANTHA_RETENTION_INTERVAL_SECONDS", 3600))
+
+FINISHED = ["complete", "failed"]
+
+
+def _chunk_summary(chunks: list[dict]) -> dict:
+    return {
+        "chunks": len(chunks),
+        "completed_chunks": sum(1 for c in chunks if c.get("status") == "complete"),
+    }
+
+
+def collapse_outputs() -> int:
+    """Replace the output_chunks rows of finished outputs with a summary on the output row."""
+    outputs = db.table("outputs").select("*").in_("status", FINISHED).execute().data
+    outputs = [o for o in outputs if "chunk_summary" not in o]
+    if not outputs:
+        return 0
+
+    chunks_by_output = db.table("output_chunks").select("*").in_("output_id", [o["id"] for o in outputs]).group_by("output_id").execute().data
+    for output in outputs:
+        chunks = chunks_by_output.get(output["id"], [])
+        db.table("outputs").update({"chunk_summary": _chunk_summary(chunks)}).eq("id", output["id"]).execute()
+    db.table("output_chunks").delete().in_("output_id", list(chunks_by_output)).execute()
+    return len(outputs)
+
+
+def collapse_failed_uploads() -> int:
+    """Replace the chunks rows of failed uploads with a summary on the upload row.
+
+    Chunks of complete uploads are kept as rows: they hold the sam_media_id
+    every later /process request for that upload reads.
+    """
+    uploads = db.table("uploads").select("*").eq("status", "failed").execute().data
+    uploads = [u for u in uploads if "chunk_summary" not in u]
+    if not uploads:
+        return 0
+
+    chunks_by_upload = db.table("chunks").select("*").in_("upload_id", [u["id"] for u in uploads]).group_by("upload_id").execute().data
+    for upload in uploads:
+        chunks = chunks_by_upload.get(upload["id"], [])
+        db.table("uploads").update({"chunk_summary": _chunk_summary(chunks)}).eq("id", upload["id"]).execute()
+    db.table("chunks").delete().in_("upload_id", list(chunks_by_upload)).execute()
+    return len(uploads)
+
+
+def drop_expired_failures() -> int:
+    """Delete failed uploads/outputs older than FAILED_TTL_SECONDS, with their files."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=FAILED_TTL_SECONDS)).isoformat()
+
+    outputs = db.table("outputs").delete().eq("status", "failed").lt("created_at", cutoff).execute().data
+    if outputs:
+        db.table("output_chunks").delete().in_("output_id", [o["id"] for o in outputs]).execute()
+    for output in outputs:
+        shutil.rmtree(OUTPUTS_DIR / output["id"], ignore_errors=True)
+
+    uploads = db.table("uploads").delete().eq("status", "failed").lt("created_at", cutoff).execute().data
+    if uploads:
+        db.table("chunks").delete().in_("upload_id", [u["id"] for u in uploads]).execute()
+    for upload in uploads:
+        shutil.rmtree(UPLOADS_DIR / f"{upload['id']}_chunks", ignore_errors=True)
+        shutil.rmtree(UPLOADS_DIR / f"{upload['id']}_peaks", ignore_errors=True)
+        for path in UPLOADS_DIR.glob(f"{upload['id']}.*"):
+            path.unlink(missing_ok=True)
+
+    return len(outputs) + len(uploads)
+
+
+def run_retention():
+    collapsed = collapse_outputs() + collapse_failed_uploads()
+    dropped = drop_expired_failures()
+    db.compact()
+    if collapsed or dropped:
+        print(f"Retention: collapsed {collapsed} finished jobs, dropped {dropped} expired failures")
+
+
+async def retention_loop():
+    while True:
+        try:
+            await asyncio.to_thread(run_retention)
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from app.browser import BROWSER_POOL_SIZE
+from app.shards import BROWSER_SHARDS
+from app.transport import SAM_TRANSPORT, SAM_HTTP_CONNECTIONS
+
+# Chunks allowed at SAM at once across all users and jobs; by default every
+# pooled page of every shard, or every pooled connection over http
+SCHEDULER_CONCURRENCY = int(os.environ.get(
+    "SAMANTHA_SCHEDULER_CONCURRENCY",
+    SAM_HTTP_CONNECTIONS if SAM_TRANSPORT == "http" else BROWSER_POOL_SIZE * max(1, BROWSER_SHARDS)))
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class _Class:
+    """Waiting requests of one priority class, per user and per job."""
+
+    def __init__(self):
+        self.queues: dict[str, dict[str, deque]] = {}
+        self.user_time: dict[str, float] = {}
+        self.job_time: dict[str, float] = {}
+        self.job_weight: dict[str, float] = {}
+        self.virtual_time = 0.0
+
+    def add(self, user_id: str, job_id: str, weight: float, waiter):
+        jobs = self.queues.setdefault(user_id, {})
+        if not jobs:
+            # A user (or job) becoming active starts at the current virtual
+            # time, so idling doesn't bank credit
+            self.user_time[user_id] = self.virtual_time
+        if job_id not in jobs:
+            jobs[job_id] = deque()
+            active = [self.job_time[j] for j in jobs if j in self.job_time]
+            self.job_time[job_id] = min(active, default=0.0)
+            self.job_weight[job_id] = weight
+        jobs[job_id].append(waiter)
+
+    def next_flow(self, user_time: dict, job_time: dict, counts=None) -> tuple[str, str] | None:
+        # The user furthest behind in virtual time, then that user's job
+        # furthest behind
+        def waiting(user_id, job_id):
+            return counts[(user_id, job_id)] if counts is not None else len(self.queues[user_id][job_id])
+
+        users = [u for u, jobs in self.queues.items() if any(waiting(u, j) for j in jobs)]
+        if not users:
+            return None
+        user_id = min(users, key=lambda u: user_time[u])
+        jobs = [j for j in self.queues[user_id] if waiting(user_id, j)]
+        job_id = min(jobs, key=lambda j: job_time[j])
+        return user_id, job_id
+
+    def charge(self, user_id: str, job_id: str, user_time: dict, job_time: dict) -> float:
+        start = user_time[user_id]
+        user_time[user_id] += 1.0
+        job_time[job_id] += 1.0 / self.job_weight[job_id]
+        return start
+
+    def pop(self):
+        while flow := self.next_flow(self.user_time, self.job_time):
+            user_id, job_id = flow
+            waiter = self.queues[user_id][job_id].popleft()
+            self.virtual_time = max(self.virtual_time, self.charge(user_id, job_id, self.user_time, self.job_time))
+            self._prune(user_id, job_id)
+            if not waiter.done():
+                return waiter
+        return None
+
+    def remove(self, user_id: str, job_id: str, waiter):
+        queue = self.queues.get(user_id, {}).get(job_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._prune(user_id, job_id)
+
+    def _prune(self, user_id: str, job_id: str):
+        jobs = self.queues[user_id]
+        if not jobs[job_id]:
+            del jobs[job_id]
+            del self.job_time[job_id]
+            del self.job_weight[job_id]
+        if not jobs:
+            del self.queues[user_id]
+            del self.user_time[user_id]
+
+    def __len__(self):
+        return sum(len(queue) for jobs in self.queues.values() for queue in jobs.values())
+
+
+class Scheduler:
+    """Bounded-concurrency scheduler for browser work.
+
+    At most `concurrency` requests hold a slot at once. Waiting interactive
+    requests (prompts) always go before bulk ones (uploads); within a class,
+    users share slots fairly and each user's share is split across their
+    jobs by weight (start-time fair queuing on a virtual clock).
+    """
+
+    def __init__(self, concurrency: int = SCHEDULER_CONCURRENCY):
+        self.concurrency = concurrency
+        self._running = 0
+        self._classes = {INTERACTIVE: _Class(), BULK: _Class()}
+        self._stats = {"dispatched": 0, "cancelled": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    def _waiting(self) -> int:
+        return sum(len(c) for c in self._classes.values())
+
+    async def acquire(self, user_id: str, job_id: str, priority: str = BULK, weight: float = 1.0):
+        requested = time.perf_counter()
+        if self._running < self.concurrency and not self._waiting():
+            self._running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._classes[priority].add(user_id or "", job_id, weight, waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Got the slot as we were cancelled; pass it on
+                    self.release()
+                else:
+                    self._classes[priority].remove(user_id or "", job_id, waiter)
+                self._stats["cancelled"] += 1
+                raise
+
+        wait_ms = (time.perf_counter() - requested) * 1000
+        self._stats["dispatched"] += 1
+        self._stats["total_wait_ms"] += wait_ms
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+
+    def release(self):
+        self._running -= 1
+        while self._running < self.concurrency:
+            waiter = self._classes[INTERACTIVE].pop() or self._classes[BULK].pop()
+            if waiter is None:
+                break
+            # The slot is handed over directly so nobody can jump the queue
+            self._running += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, job_id: str, priority: str = BULK, weight: float = 1.0):
+        await self.acquire(user_id, job_id, priority, weight)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def queue_position(self, job_id: str) -> int | None:
+        """Requests that will be dispatched before the job's next one, or
+        None if the job has nothing waiting."""
+        ahead = 0
+        for queued in self._classes.values():
+            counts = {
+                (user_id, j): len(queue)
+                for user_id, jobs in queued.queues.items()
+                for j, queue in jobs.items()
+            }
+            user_time = dict(queued.user_time)
+            job_time = dict(queued.job_time)
+            # Replay the dispatch order on counts only
+            while flow := queued.next_flow(user_time, job_time, counts):
+                if flow[1] == job_id:
+                    return ahead
+                counts[flow] -= 1
+                queued.charge(*flow, user_time, job_time)
+                ahead += 1
+        return None
+
+    def stats(self) -> dict:
+        dispatched = self._stats["dispatched"]
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "waiting": {name: len(queued) for name, queued in self._classes.items()},
+            "users_waiting": len(set().union(*(queued.queues for queued in self._classes.values()))),
+            "dispatched": dispatched,
+            "cancelled": self._stats["cancelled"],
+            "avg_wait_ms": self._stats["total_wait_ms"] / dispatched if dispatched else 0.0,
+            "max_wait_ms": self._stats["max_wait_ms"],
+        }
+
+
+scheduler = Scheduler()
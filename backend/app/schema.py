@@ -0,0 +1,10 @@
+TABLES = ["uploads", "chunks", "outputs", "output_chunks"]
+
+# Indexes every backend builds; .eq()/.in_() filters covering an index's
+# fields are answered from it instead of scanning the table
+INDEXES = {
+    "uploads": [("id",), ("user_id",), ("content_hash",)],
+    "chunks": [("upload_id",), ("upload_id", "chunk_index"), ("content_hash",)],
+    "outputs": [("id",), ("upload_id",)],
+    "output_chunks": [("output_id",), ("output_id", "chunk_index")],
+}
@@ -0,0 +1,306 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+
+from app.browser import BrowserManager, BROWSER_POOL_SIZE, PAGE_LINGER_S, browser_manager as local_browser_manager
+
+# Browser worker processes, each with its own Playwright, Chrome and page
+# pool; 0 keeps the single in-process BrowserManager
+BROWSER_SHARDS = int(os.environ.get("SAMANTHA_BROWSER_SHARDS", 0))
+
+SHARD_START_TIMEOUT_S = 120
+SHARD_STOP_TIMEOUT_S = 15
+SHARD_STATS_INTERVAL_S = 5
+
+# Methods the API process may call on a shard's BrowserManager
+SHARD_METHODS = {"upload_chunk_to_sam", "upload_and_prompt", "process_chunk_prompts"}
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def _frame(message) -> bytes:
+    # Length-prefixed pickle; both ends are this codebase on this machine
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return _FRAME_HEADER.pack(len(data)) + data
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    header = await reader.readexactly(_FRAME_HEADER.size)
+    (size,) = _FRAME_HEADER.unpack(header)
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _shard_main(shard_id: int, socket_path: str):
+    asyncio.run(_serve_shard(shard_id, socket_path))
+
+
+async def _serve_shard(shard_id: int, socket_path: str):
+    manager = BrowserManager()
+    await manager.start()
+    stopping = asyncio.Event()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(request_id: int, method: str, args: tuple, kwargs: dict):
+            try:
+                if method == "stats":
+                    result = manager.stats()
+                elif method == "shutdown":
+                    stopping.set()
+                    result = None
+                elif method in SHARD_METHODS:
+                    result = await getattr(manager, method)(*args, **kwargs)
+                else:
+                    raise ValueError(f"Unknown shard method: {method!r}")
+                frame = _frame((request_id, True, result))
+            except Exception as e:
+                try:
+                    frame = _frame((request_id, False, e))
+                except Exception:
+                    frame = _frame((request_id, False, RuntimeError(repr(e))))
+            async with write_lock:
+                writer.write(frame)
+                await writer.drain()
+
+        try:
+            while True:
+                request = await _read_frame(reader)
+                task = asyncio.create_task(answer(*request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Parent went away, or the shard is shutting down
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    print(f"Browser shard {shard_id} listening on {socket_path}")
+    try:
+        await stopping.wait()
+    finally:
+        server.close()
+        await manager.stop()
+
+
+class BrowserShard:
+    """API-side handle on one browser worker process."""
+
+    def __init__(self, shard_id: int, socket_path: str):
+        self.shard_id = shard_id
+        self.socket_path = socket_path
+        self.process: multiprocessing.Process | None = None
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self.healthy = False
+        self.in_flight = 0
+        self.pool_stats: dict = {}
+        self._stats = {"routed": 0, "completed": 0, "failed": 0, "total_ms": 0.0}
+
+    def spawn(self):
+        # Not a daemon: the shard starts its own Playwright driver process
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=_shard_main, args=(self.shard_id, self.socket_path), name=f"browser-shard-{self.shard_id}",
+        )
+        self.process.start()
+
+    async def connect(self):
+        # The shard only listens once its browser is up
+        deadline = time.monotonic() + SHARD_START_TIMEOUT_S
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Browser shard {self.shard_id} exited during startup")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Browser shard {self.shard_id} did not start in time")
+                await asyncio.sleep(0.2)
+        self._read_task = asyncio.create_task(self._read_loop())
+        self.healthy = True
+
+    async def _read_loop(self):
+        try:
+            while True:
+                request_id, ok, result = await _read_frame(self._reader)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.healthy = False
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Browser shard {self.shard_id} disconnected"))
+            self._pending.clear()
+
+    async def call(self, method: str, *args, **kwargs):
+        if not self.healthy:
+            raise ConnectionError(f"Browser shard {self.shard_id} is not available")
+        request_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(_frame((request_id, method, args, kwargs)))
+        await self._writer.drain()
+        return await future
+
+    async def run(self, method: str, *args, **kwargs):
+        # A routed chunk task, counted for load and utilization
+        started = time.perf_counter()
+        self.in_flight += 1
+        self._stats["routed"] += 1
+        try:
+            result = await self.call(method, *args, **kwargs)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self._stats["completed"] += 1
+        self._stats["total_ms"] += (time.perf_counter() - started) * 1000
+        return result
+
+    async def stop(self):
+        if self.healthy:
+            try:
+                await asyncio.wait_for(self.call("shutdown"), SHARD_STOP_TIMEOUT_S)
+            except Exception:
+                pass
+        if self._writer:
+            self._writer.close()
+        if self._read_task:
+            self._read_task.cancel()
+        if self.process:
+            await asyncio.to_thread(self.process.join, SHARD_STOP_TIMEOUT_S)
+            if self.process.is_alive():
+                self.process.terminate()
+
+    def stats(self) -> dict:
+        completed = self._stats["completed"]
+        return {
+            "shard": self.shard_id,
+            "pid": self.process.pid if self.process else None,
+            "alive": bool(self.process and self.process.is_alive()),
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "utilization": self.in_flight / BROWSER_POOL_SIZE,
+            "routed": self._stats["routed"],
+            "completed": completed,
+            "failed": self._stats["failed"],
+            "avg_ms": self._stats["total_ms"] / completed if completed else 0.0,
+            "pool": self.pool_stats,
+        }
+
+
+class ShardedBrowser:
+    """Drop-in for BrowserManager that spreads chunk tasks over browser
+    worker processes, routing each to the least loaded healthy shard."""
+
+    def __init__(self, shards: int = BROWSER_SHARDS):
+        self._socket_dir: str | None = None
+        self._shards: list[BrowserShard] = []
+        self._count = shards
+        self._stats_task: asyncio.Task | None = None
+        # Shard holding the page parked on each recently uploaded media
+        self._media_shards: OrderedDict[str, tuple[BrowserShard, float]] = OrderedDict()
+
+    async def start(self):
+        self._socket_dir = tempfile.mkdtemp(prefix="samantha-shards-")
+        self._shards = [
+            BrowserShard(i, os.path.join(self._socket_dir, f"shard-{i}.sock"))
+            for i in range(self._count)
+        ]
+        for shard in self._shards:
+            shard.spawn()
+        results = await asyncio.gather(*(shard.connect() for shard in self._shards), return_exceptions=True)
+        for shard, result in zip(self._shards, results):
+            if isinstance(result, BaseException):
+                print(f"Browser shard {shard.shard_id} failed to start: {result}")
+        if not any(shard.healthy for shard in self._shards):
+            await self.stop()
+            raise RuntimeError("No browser shard started")
+        self._stats_task = asyncio.create_task(self._poll_stats())
+        print(f"Browser started with {sum(s.healthy for s in self._shards)}/{self._count} shards")
+
+    async def stop(self):
+        if self._stats_task:
+            self._stats_task.cancel()
+        await asyncio.gather(*(shard.stop() for shard in self._shards), return_exceptions=True)
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+        print("Browser stopped")
+
+    async def _poll_stats(self):
+        while True:
+            for shard in self._shards:
+                if shard.healthy:
+                    try:
+                        shard.pool_stats = await asyncio.wait_for(shard.call("stats"), SHARD_STATS_INTERVAL_S)
+                    except Exception:
+                        pass
+            await asyncio.sleep(SHARD_STATS_INTERVAL_S)
+
+    def _route(self) -> BrowserShard:
+        healthy = [shard for shard in self._shards if shard.healthy]
+        if not healthy:
+            raise RuntimeError("No healthy browser shard")
+        return min(healthy, key=lambda shard: (shard.in_flight, shard._stats["routed"]))
+
+    def _route_media(self, sam_media_id: str) -> BrowserShard:
+        # Prompts go to the shard whose page still has the media loaded
+        expired = time.monotonic() - PAGE_LINGER_S
+        while self._media_shards and next(iter(self._media_shards.values()))[1] < expired:
+            self._media_shards.popitem(last=False)
+        entry = self._media_shards.pop(sam_media_id, None)
+        if entry is not None and entry[0].healthy:
+            return entry[0]
+        return self._route()
+
+    async def upload_chunk_to_sam(self, file_path: str) -> str:
+        shard = self._route()
+        sam_media_id = await shard.run("upload_chunk_to_sam", file_path)
+        self._media_shards[sam_media_id] = (shard, time.monotonic())
+        return sam_media_id
+
+    async def upload_and_prompt(self, file_path: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> tuple[str, list | Exception]:
+        shard = self._route()
+        sam_media_id, results = await shard.run("upload_and_prompt", file_path, prompts, output_dirs, chunk_index)
+        self._media_shards[sam_media_id] = (shard, time.monotonic())
+        return sam_media_id, results
+    
+    async def process_chunk_prompts(self, sam_media_id: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> list[dict]:
+        shard = self._route_media(sam_media_id)
+        return await shard.run("process_chunk_prompts", sam_media_id, prompts, output_dirs, chunk_index)
+
+    def stats(self) -> dict:
+        shards = [shard.stats() for shard in self._shards]
+        return {
+            "shards": len(shards),
+            "healthy": sum(s["healthy"] for s in shards),
+            "in_flight": sum(s["in_flight"] for s in shards),
+            "utilization": sum(s["in_flight"] for s in shards) / (BROWSER_POOL_SIZE * len(shards) or 1),
+            "per_shard": shards,
+        }
+
+
+browser_manager = ShardedBrowser(BROWSER_SHARDS) if BROWSER_SHARDS > 0 else local_browser_manager
@@ -0,0 +1,337 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app.query import Database
+from app.schema import TABLES, INDEXES
+
+DB_PATH = Path(__file__).parent.parent / "data.sqlite3"
+
+# Bookkeeping outside the app's tables, e.g. whether data.json was imported
+META_TABLE = "_meta"
+
+# Fields stored in their own column so they can be indexed; every other field
+# only lives in the row's JSON `data` column
+COLUMNS = {
+    "uploads": ["id", "user_id", "status", "created_at", "content_hash"],
+    "chunks": ["upload_id", "chunk_index", "status", "content_hash"],
+    "outputs": ["id", "upload_id", "user_id", "status", "created_at"],
+    "output_chunks": ["output_id", "chunk_index", "status"],
+}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteStore:
+    """Stores each table as rows of JSON in an SQLite database in WAL mode.
+
+    Rows stay schemaless like in data.json: the full record is kept in a JSON
+    `data` column, and the fields listed in COLUMNS are copied into real
+    columns so INDEXES can be built on them. WAL lets several uvicorn workers
+    read while one writes. Every thread gets its own connection; statements
+    are built from the same templates so sqlite3's statement cache reuses the
+    prepared versions.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._ready = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"queries": 0, "writes": 0, "total_write_ms": 0.0, "max_write_ms": 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if self._ready:
+                return
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(META_TABLE)} (key TEXT PRIMARY KEY, value TEXT)")
+            for name in TABLES:
+                self._create_table(conn, name)
+            for name, index_list in INDEXES.items():
+                for fields in index_list:
+                    self._create_index(conn, name, fields)
+            self._ready = True
+
+        # One-shot migration from data.json; the marker makes every later
+        # start (and every other worker) skip it
+        from app.json_db import DB_FILE, JOURNAL_FILE
+        if (DB_FILE.exists() or JOURNAL_FILE.exists()) and not self._imported(conn):
+            self.import_json()
+
+    def _imported(self, conn) -> bool:
+        return conn.execute(
+            f"SELECT 1 FROM {_quote(META_TABLE)} WHERE key = 'json_imported'"
+        ).fetchone() is not None
+
+    def _create_table(self, conn, name):
+        columns = "".join(f", {_quote(c)}" for c in COLUMNS.get(name, []))
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(name)} "
+            f"(rowid INTEGER PRIMARY KEY{columns}, data TEXT NOT NULL)"
+        )
+
+        # Columns added to COLUMNS after the table was created
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(name)})")}
+        for column in COLUMNS.get(name, []):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {_quote(name)} ADD COLUMN {_quote(column)}")
+                conn.execute(
+                    f"UPDATE {_quote(name)} SET {_quote(column)} = "
+                    f"json_extract(data, {_sql_string('$.' + json.dumps(column))})"
+                )
+
+    def _create_index(self, conn, name, fields):
+        self._create_table(conn, name)
+        index_name = f"idx_{name}_{'_'.join(fields)}"
+        exprs = ", ".join(self._field(name, f) for f in fields)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(name)} ({exprs})")
+
+    def _field(self, table_name, field):
+        if field in COLUMNS.get(table_name, []):
+            return _quote(field)
+        # Only ever interpolated after passing through json.dumps, so it's a
+        # valid JSON path string
+        return f"json_extract(data, {_sql_string('$.' + json.dumps(field))})"
+
+    def _where(self, table_name, filters):
+        clauses = []
+        params = []
+        for field, op, value in filters:
+            if isinstance(field, (tuple, list)):
+                expr = ", ".join(self._field(table_name, f) for f in field)
+            else:
+                expr = self._field(table_name, field)
+            if op == "eq":
+                if value is None:
+                    clauses.append(f"{expr} IS NULL")
+                else:
+                    clauses.append(f"{expr} = ?")
+                    params.append(value)
+            elif op == "in":
+                if not value:
+                    clauses.append("0")
+                else:
+                    clauses.append(f"{expr} IN ({', '.join('?' * len(value))})")
+                    params.extend(value)
+            elif op == "lt":
+                if isinstance(field, (tuple, list)):
+                    clauses.append(f"({expr}) < ({', '.join('?' * len(value))})")
+                    params.extend(value)
+                else:
+                    clauses.append(f"{expr} < ?")
+                    params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def _row_params(self, table_name, record):
+        return [record.get(c) for c in COLUMNS.get(table_name, [])] + [json.dumps(record)]
+
+    def _record_write(self, started):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            self._stats["writes"] += 1
+            self._stats["total_write_ms"] += elapsed_ms
+            self._stats["max_write_ms"] = max(self._stats["max_write_ms"], elapsed_ms)
+
+    def load(self):
+        self._connect()
+
+    def create_index(self, table_name, fields):
+        self._create_index(self._connect(), table_name, tuple(fields))
+
+    def compact(self):
+        self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = {"backend": "sqlite", "path": str(self.path), **self._stats}
+        total_write_ms = stats.pop("total_write_ms")
+        stats["avg_write_ms"] = total_write_ms / stats["writes"] if stats["writes"] else 0.0
+        return stats
+
+    def insert(self, table_name, records):
+        conn = self._connect()
+        started = time.monotonic()
+        created_at = datetime.utcnow().isoformat()
+        for record in records:
+            if "created_at" not in record:
+                record["created_at"] = created_at
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert_rows(conn, table_name, records)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._record_write(started)
+        return records
+
+    def _insert_rows(self, conn, table_name, records):
+        columns = COLUMNS.get(table_name, [])
+        names = ", ".join([_quote(c) for c in columns] + ["data"])
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        conn.executemany(
+            f"INSERT INTO {_quote(table_name)} ({names}) VALUES ({placeholders})",
+            [self._row_params(table_name, r) for r in records],
+        )
+
+    def update(self, table_name, filters, updates):
+        conn = self._connect()
+        started = time.monotonic()
+        where, params = self._where(table_name, filters)
+        columns = COLUMNS.get(table_name, [])
+        assignments = ", ".join([f"{_quote(c)} = ?" for c in columns] + ["data = ?"])
+
+        # Read-modify-write in one transaction; BEGIN IMMEDIATE takes the write
+        # lock up front so another process can't change the rows in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = []
+            for rowid, data in conn.execute(f"SELECT rowid, data FROM {_quote(table_name)}{where}", params):
+                record = json.loads(data)
+                record.update(updates)
+                updated.append((rowid, record))
+            conn.executemany(
+                f"UPDATE {_quote(table_name)} SET {assignments} WHERE rowid = ?",
+                [self._row_params(table_name, r) + [rowid] for rowid, r in updated],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._record_write(started)
+        return [r for _, r in updated]
+
+    def delete(self, table_name, filters):
+        conn = self._connect()
+        started = time.monotonic()
+        where, params = self._where(table_name, filters)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = [json.loads(data) for data, in conn.execute(f"SELECT data FROM {_quote(table_name)}{where}", params)]
+            conn.execute(f"DELETE FROM {_quote(table_name)}{where}", params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._record_write(started)
+        return deleted
+
+    def select(self, table_name, filters, order=None, limit=None):
+        conn = self._connect()
+        where, params = self._where(table_name, filters)
+        if order:
+            # rowid last, in the direction of the first key, keeps ties in
+            # insertion order
+            terms = [f"{self._field(table_name, field)}{' DESC' if desc else ''}" for field, desc in order]
+            terms.append(f"rowid{' DESC' if order[0][1] else ''}")
+            order = f" ORDER BY {', '.join(terms)}"
+        else:
+            order = " ORDER BY rowid"
+        if limit is not None:
+            order += " LIMIT ?"
+            params.append(limit)
+        with self._stats_lock:
+            self._stats["queries"] += 1
+        try:
+            rows = conn.execute(f"SELECT data FROM {_quote(table_name)}{where}{order}", params)
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return []
+            raise
+        return [json.loads(data) for data, in rows]
+
+    async def ainsert(self, table_name, records):
+        return await asyncio.to_thread(self.insert, table_name, records)
+
+    async def aupdate(self, table_name, filters, updates):
+        return await asyncio.to_thread(self.update, table_name, filters, updates)
+
+    async def adelete(self, table_name, filters):
+        return await asyncio.to_thread(self.delete, table_name, filters)
+
+    async def aselect(self, table_name, filters, order=None, limit=None):
+        return await asyncio.to_thread(self.select, table_name, filters, order, limit)
+
+    def import_json(self):
+        """Copy every row from data.json (and its journal) into this database.
+
+        Does nothing if it was done before or the database already holds
+        rows. The check, the import and the marker recording it happen in one
+        write transaction, so workers starting at once import only once and
+        none of them reads the database half imported.
+        """
+        from app.json_db import JsonStore
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._imported(conn):
+                # Another worker got here first
+                conn.execute("ROLLBACK")
+                return
+            conn.execute(
+                f"INSERT INTO {_quote(META_TABLE)} (key, value) VALUES ('json_imported', ?)",
+                (datetime.utcnow().isoformat(),),
+            )
+            for name in TABLES:
+                if conn.execute(f"SELECT 1 FROM {_quote(name)} LIMIT 1").fetchone():
+                    print(f"{self.path} already has data, not importing data.json")
+                    conn.execute("COMMIT")
+                    return
+
+            source = JsonStore()
+            tables = source.dump()
+            source.close()
+
+            for name, rows in tables.items():
+                if name not in TABLES:
+                    self._create_table(conn, name)
+                if rows:
+                    self._insert_rows(conn, name, rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        for name, rows in tables.items():
+            print(f"Imported {len(rows)} {name} rows into {self.path}")
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+sqlite_db = Database(SqliteStore())
+
+
+if __name__ == "__main__":
+    # python -m app.sqlite_db [path] -- import data.json into an empty database
+    store = SqliteStore(sys.argv[1]) if len(sys.argv) > 1 else sqlite_db.store
+    store.import_json()
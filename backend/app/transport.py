@@ -0,0 +1,297 @@
+import asyncio
+import json
+import mimetypes
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from app.browser import (
+    BrowserManager, SAM_BASE_URL, SAM_GRAPHQL_URL, SAM_RESULT_KEYS, find_value, parse_graphql_payloads,
+)
+from app.shards import browser_manager
+
+# How upload and prompt calls reach SAM: "browser" drives the demo UI;
+# "http" calls its GraphQL endpoint directly and only uses a browser to
+# harvest session tokens
+SAM_TRANSPORT = os.environ.get("SAMANTHA_SAM_TRANSPORT", "browser")
+
+# Keep-alive connections shared by all HTTP calls to SAM
+SAM_HTTP_CONNECTIONS = int(os.environ.get("SAMANTHA_SAM_HTTP_CONNECTIONS", 32))
+SAM_HTTP_TIMEOUT_S = 120
+
+# Harvested sessions are refreshed after this long, or as soon as SAM
+# rejects one
+SAM_SESSION_TTL_S = int(os.environ.get("SAMANTHA_SAM_SESSION_TTL_SECONDS", 1800))
+
+# Error codes in a GraphQL payload that mean the session is no longer valid
+# (not logged in, bad lsd token); any other error fails the call as is
+SAM_AUTH_ERROR_CODES = set(os.environ.get("SAMANTHA_SAM_AUTH_ERROR_CODES", "1357001,1357004").split(","))
+
+# The prompt query, as sent by the demo page (see its GraphQL requests)
+SAM_PROMPT_DOC_ID = os.environ.get("SAMANTHA_SAM_PROMPT_DOC_ID", "")
+SAM_PROMPT_QUERY_NAME = os.environ.get("SAMANTHA_SAM_PROMPT_QUERY_NAME", "useSAMAudioSeparateQuery")
+
+# Uploads are a multipart POST of the file with the session's form fields;
+# set a doc id if the live page sends the upload as a named query. The media
+# id is read from this dotted path in the response
+SAM_UPLOAD_DOC_ID = os.environ.get("SAMANTHA_SAM_UPLOAD_DOC_ID", "")
+SAM_UPLOAD_QUERY_NAME = os.environ.get("SAMANTHA_SAM_UPLOAD_QUERY_NAME", "useSAMUploadMediaMutation")
+SAM_UPLOAD_ID_PATH = os.environ.get("SAMANTHA_SAM_UPLOAD_ID_PATH", "data.media.id")
+
+# After uploading, SAM processes the media; useSAMUploadMediaQuery is polled
+# until the status at this path says it's done
+SAM_UPLOAD_STATUS_DOC_ID = os.environ.get("SAMANTHA_SAM_UPLOAD_STATUS_DOC_ID", "25521794540750262")
+SAM_UPLOAD_STATUS_QUERY_NAME = "useSAMUploadMediaQuery"
+SAM_UPLOAD_STATUS_PATH = os.environ.get("SAMANTHA_SAM_UPLOAD_STATUS_PATH", "data.media.status")
+SAM_UPLOAD_POLL_INTERVAL_S = 1
+SAM_UPLOAD_POLL_TIMEOUT_S = 120
+
+
+def error_codes(payload) -> set[str]:
+    # Ajax errors are {"error": code, ...}; GraphQL ones {"errors": [{"code": ...}]}
+    if not isinstance(payload, dict):
+        return set()
+    codes = set()
+    if payload.get("error"):
+        codes.add(str(payload["error"]))
+    for error in payload.get("errors") or []:
+        if isinstance(error, dict):
+            codes.add(str(error.get("code")))
+    return codes
+
+
+def get_path(payloads: list, path: str):
+    # Value at a dotted path in the first NDJSON payload that has it
+    for payload in payloads:
+        value = payload
+        for key in path.split("."):
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            return value
+    return None
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class BrowserTransport:
+    """SAM through the demo UI, on BrowserManager pages (or its shards)."""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    async def start(self):
+        await self.manager.start()
+
+    async def stop(self):
+        await self.manager.stop()
+
+    async def upload_chunk_to_sam(self, file_path: str) -> str:
+        return await self.manager.upload_chunk_to_sam(file_path)
+
+    async def upload_and_prompt(self, file_path: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> tuple[str, list | Exception]:
+        return await self.manager.upload_and_prompt(file_path, prompts, output_dirs, chunk_index)
+
+    async def process_chunk_prompts(self, sam_media_id: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> list[dict]:
+        return await self.manager.process_chunk_prompts(sam_media_id, prompts, output_dirs, chunk_index)
+
+    def stats(self) -> dict:
+        return {"transport": "browser"}
+
+
+class HttpTransport:
+    """SAM through its GraphQL endpoint on a pooled keep-alive client.
+
+    An upload or a prompt is one request; the browser is only used to
+    harvest a session (cookies, tokens) and to refresh it when it expires.
+    """
+
+    def __init__(self, manager: BrowserManager):
+        self.manager = manager
+        self._client: httpx.AsyncClient | None = None
+        self._session: dict | None = None
+        self._refresh_lock = asyncio.Lock()
+        self._stats = {"requests": 0, "failed": 0, "refreshes": 0, "retries": 0, "total_ms": 0.0}
+
+    async def start(self):
+        if not SAM_PROMPT_DOC_ID:
+            raise RuntimeError("SAMANTHA_SAM_PROMPT_DOC_ID is required for the http transport")
+        self._client = httpx.AsyncClient(
+            base_url=SAM_BASE_URL,
+            limits=httpx.Limits(max_connections=SAM_HTTP_CONNECTIONS, max_keepalive_connections=SAM_HTTP_CONNECTIONS),
+            timeout=httpx.Timeout(SAM_HTTP_TIMEOUT_S, connect=10),
+        )
+        await self.manager.start()
+        try:
+            await self._refresh(None)
+        except Exception as e:
+            # Retried on the first call
+            print(f"Harvesting SAM session failed: {e!r}")
+
+    async def stop(self):
+        if self._client:
+            await self._client.aclose()
+        await self.manager.stop()
+
+    async def _refresh(self, stale: dict | None) -> dict:
+        async with self._refresh_lock:
+            # Someone else refreshed while we waited
+            if self._session is not stale and self._session is not None:
+                return self._session
+            self._session = await self.manager.harvest_session()
+            self._client.cookies.clear()
+            self._client.cookies.update(self._session["cookies"])
+            self._stats["refreshes"] += 1
+            return self._session
+
+    async def _current_session(self) -> dict:
+        session = self._session
+        if session is None or time.time() - session["harvested_at"] > SAM_SESSION_TTL_S:
+            session = await self._refresh(session)
+        return session
+
+    async def _graphql(self, data: dict, files: dict | None = None, friendly_name: str | None = None) -> list:
+        started = time.perf_counter()
+        self._stats["requests"] += 1
+        try:
+            session = await self._current_session()
+            for attempt in range(2):
+                headers = dict(session["headers"])
+                if friendly_name:
+                    headers["x-fb-friendly-name"] = friendly_name
+                response = await self._client.post(
+                    SAM_GRAPHQL_URL, data={**session["form"], **data}, files=files, headers=headers,
+                )
+                try:
+                    if response.status_code in (401, 403):
+                        raise SessionExpired(f"SAM rejected the session ({response.status_code})")
+                    response.raise_for_status()
+                    payloads = parse_graphql_payloads(response.text)
+                    failed = [p for p in payloads if error_codes(p)]
+                    if any(error_codes(p) & SAM_AUTH_ERROR_CODES for p in failed):
+                        raise SessionExpired(f"SAM rejected the session: {failed[0]}")
+                    if failed:
+                        raise Exception(f"SAM returned an error: {failed[0]}")
+                    return payloads
+                except SessionExpired:
+                    if attempt:
+                        raise
+                    self._stats["retries"] += 1
+                    session = await self._refresh(session)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+    def _query(self, doc_id: str, friendly_name: str, variables: dict) -> dict:
+        return {
+            "fb_api_caller_class": "RelayModern",
+            "fb_api_req_friendly_name": friendly_name,
+            "server_timestamps": "true",
+            "variables": json.dumps(variables),
+            "doc_id": doc_id,
+        }
+
+    async def upload_chunk_to_sam(self, file_path: str) -> str:
+        content = await asyncio.to_thread(Path(file_path).read_bytes)
+        content_type = mimetypes.guess_type(file_path)[0] or "audio/mpeg"
+        data = self._query(SAM_UPLOAD_DOC_ID, SAM_UPLOAD_QUERY_NAME, {}) if SAM_UPLOAD_DOC_ID else {}
+        payloads = await self._graphql(
+            data, files={"file": (os.path.basename(file_path), content, content_type)},
+            friendly_name=SAM_UPLOAD_QUERY_NAME if SAM_UPLOAD_DOC_ID else None,
+        )
+        sam_media_id = get_path(payloads, SAM_UPLOAD_ID_PATH)
+        # SAM media ids are numeric, like the media_id the page navigates to
+        if not isinstance(sam_media_id, (str, int)) or not str(sam_media_id).isdigit():
+            raise Exception(f"SAM upload response has no media id at {SAM_UPLOAD_ID_PATH}")
+        sam_media_id = str(sam_media_id)
+        await self._wait_until_processed(sam_media_id)
+        return sam_media_id
+
+    async def _wait_until_processed(self, sam_media_id: str):
+        deadline = time.monotonic() + SAM_UPLOAD_POLL_TIMEOUT_S
+        while True:
+            payloads = await self._graphql(
+                self._query(SAM_UPLOAD_STATUS_DOC_ID, SAM_UPLOAD_STATUS_QUERY_NAME, {"id": sam_media_id}),
+                friendly_name=SAM_UPLOAD_STATUS_QUERY_NAME,
+            )
+            status = str(get_path(payloads, SAM_UPLOAD_STATUS_PATH) or "").lower()
+            if any(word in status for word in ("complete", "ready", "success")):
+                return
+            if any(word in status for word in ("error", "fail")):
+                raise Exception(f"SAM failed to process the upload: {status}")
+            if time.monotonic() > deadline:
+                raise Exception("Timed out waiting for SAM to process the upload")
+            await asyncio.sleep(SAM_UPLOAD_POLL_INTERVAL_S)
+
+    async def _prompt(self, sam_media_id: str, prompt: str, chunk_output_dir: str) -> dict:
+        payloads = await self._graphql(
+            self._query(SAM_PROMPT_DOC_ID, SAM_PROMPT_QUERY_NAME, {"media_id": sam_media_id, "prompt": prompt}),
+            friendly_name=SAM_PROMPT_QUERY_NAME,
+        )
+
+        urls = {}
+        for output_type, key in SAM_RESULT_KEYS.items():
+            urls[output_type] = find_value(payloads, {key})
+            if not urls[output_type]:
+                raise Exception(f"SAM prompt response has no {key}")
+
+        async def download(url: str, save_path: str) -> str:
+            # Streamed to disk so only a block per download is in memory
+            async with self._client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(save_path, "wb") as f:
+                    async for block in response.aiter_bytes():
+                        f.write(block)
+            return save_path
+
+        os.makedirs(chunk_output_dir, exist_ok=True)
+        paths = await asyncio.gather(*(
+            download(url, os.path.join(chunk_output_dir, f"{output_type}.wav")) for output_type, url in urls.items()
+        ))
+        return dict(zip(urls, paths))
+
+    async def upload_and_prompt(self, file_path: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> tuple[str, list | Exception]:
+        sam_media_id = await self.upload_chunk_to_sam(file_path)
+        try:
+            return sam_media_id, await self.process_chunk_prompts(sam_media_id, prompts, output_dirs, chunk_index)
+        except Exception as e:
+            return sam_media_id, e
+
+    async def process_chunk_prompts(self, sam_media_id: str, prompts: list[str], output_dirs: list[str], chunk_index: int) -> list[dict]:
+        # No page to share here, so the prompts just run side by side
+        return list(await asyncio.gather(*(
+            self._prompt(sam_media_id, prompt, os.path.join(output_dir, f"chunk_{chunk_index}"))
+            for prompt, output_dir in zip(prompts, output_dirs)
+        )))
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        requests = stats["requests"]
+        session = self._session
+        return {
+            "transport": "http",
+            "base_url": SAM_BASE_URL,
+            "max_connections": SAM_HTTP_CONNECTIONS,
+            "requests": requests,
+            "failed": stats["failed"],
+            "retries": stats["retries"],
+            "session_refreshes": stats["refreshes"],
+            "session_age_s": time.time() - session["harvested_at"] if session else None,
+            "avg_ms": stats["total_ms"] / requests if requests else 0.0,
+        }
+
+
+if SAM_TRANSPORT == "http":
+    # Harvesting needs a single page, not a pool
+    sam = HttpTransport(BrowserManager(pool_size=1))
+elif SAM_TRANSPORT == "browser":
+    sam = BrowserTransport(browser_manager)
+else:
+    raise ValueError(f"Unknown SAMANTHA_SAM_TRANSPORT: {SAM_TRANSPORT!r}")
@@ -0,0 +1,128 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Processes doing CPU-bound audio work (probing, splitting, stitching)
+AUDIO_WORKERS = int(os.environ.get("SAMANTHA_AUDIO_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Jobs allowed to be queued in or running on the pool at once; further
+# callers wait their turn on the event loop instead of piling up in the pool
+AUDIO_QUEUE_SIZE = int(os.environ.get("SAMANTHA_AUDIO_QUEUE_SIZE", 16))
+
+
+def _timed_call(fn, args, kwargs):
+    # Runs in the worker process; wall-clock times so the parent can tell
+    # queueing apart from running
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+class AudioExecutor:
+    """Runs audio functions on a process pool so they don't block the event loop."""
+
+    def __init__(self, workers: int = AUDIO_WORKERS, queue_size: int = AUDIO_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._waiting = 0
+        self._in_pool = 0
+        self._stats = {
+            "completed": 0,
+            "failed": 0,
+            "total_queue_wait_ms": 0.0,
+            "max_queue_wait_ms": 0.0,
+            "total_run_ms": 0.0,
+            "max_run_ms": 0.0,
+            "pool_restarts": 0,
+        }
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn rather than fork: the API process runs threads (DB writer,
+        # Playwright) that a forked child would inherit in an unknown state
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        # A worker died (e.g. killed for memory) and took the pool with it;
+        # every job after would fail, so start a new one. Jobs that were on
+        # the broken pool fail, and only the first of them replaces it
+        if self._pool is not broken:
+            return
+        self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._stats["pool_restarts"] += 1
+        print("Audio pool broken by a dead worker, restarted")
+
+    def start(self):
+        self._pool = self._new_pool()
+        self._slots = asyncio.Semaphore(self.queue_size)
+        print(f"Audio pool started with {self.workers} workers")
+
+    def stop(self):
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        print("Audio pool stopped")
+
+    async def run(self, fn, *args, **kwargs):
+        if not self._pool:
+            raise RuntimeError("Audio pool not started")
+
+        submitted = time.time()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_pool += 1
+        pool = self._pool
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(pool, _timed_call, fn, args, kwargs)
+        except BrokenProcessPool:
+            self._stats["failed"] += 1
+            self._replace_pool(pool)
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._in_pool -= 1
+            self._slots.release()
+
+        queue_wait_ms = max(0.0, started - submitted) * 1000
+        run_ms = (finished - started) * 1000
+        self._stats["completed"] += 1
+        self._stats["total_queue_wait_ms"] += queue_wait_ms
+        self._stats["max_queue_wait_ms"] = max(self._stats["max_queue_wait_ms"], queue_wait_ms)
+        self._stats["total_run_ms"] += run_ms
+        self._stats["max_run_ms"] = max(self._stats["max_run_ms"], run_ms)
+        return result
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        completed = stats["completed"]
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "waiting": self._waiting,
+            "in_pool": self._in_pool,
+            "completed": completed,
+            "failed": stats["failed"],
+            "avg_queue_wait_ms": stats["total_queue_wait_ms"] / completed if completed else 0.0,
+            "max_queue_wait_ms": stats["max_queue_wait_ms"],
+            "avg_run_ms": stats["total_run_ms"] / completed if completed else 0.0,
+            "max_run_ms": stats["max_run_ms"],
+            "pool_restarts": stats["pool_restarts"],
+        }
+
+
+audio_executor = AudioExecutor()
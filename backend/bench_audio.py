@@ -0,0 +1,105 @@
+import argparse
+import array
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+# Benchmark for output stitching: time and peak RSS against chunk count.
+#
+#   python bench_audio.py                  # default chunk counts
+#   python bench_audio.py --chunks 10 50   # custom chunk counts
+#
+# Every measurement runs in a fresh process so peak RSS isn't shared between
+# runs. "legacy" is the old pydub `combined += audio` loop, run once per
+# output format like run_process_prompt used to; "stitch" is stitch_audio().
+
+CHUNK_SECONDS = 29
+FRAME_RATE = 44100
+CHANNELS = 2
+
+
+def make_chunks(directory: str, count: int) -> list[str]:
+    # One second of a stereo sine tone, repeated to the chunk length
+    second = array.array("h", [
+        int(8000 * math.sin(2 * math.pi * 440 * i / FRAME_RATE))
+        for i in range(FRAME_RATE)
+        for _ in range(CHANNELS)
+    ]).tobytes()
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"chunk_{i}.wav")
+        with wave.open(path, "wb") as w:
+            w.setnchannels(CHANNELS)
+            w.setsampwidth(2)
+            w.setframerate(FRAME_RATE)
+            for _ in range(CHUNK_SECONDS):
+                w.writeframes(second)
+        paths.append(path)
+    return paths
+
+
+def run_once(method: str, paths: list[str], output_dir: str):
+    from app.audio import stitch_audio
+    from pydub import AudioSegment
+
+    outputs = {
+        "wav": os.path.join(output_dir, "out.wav"),
+        "mp3": os.path.join(output_dir, "out.mp3"),
+    }
+
+    started = time.perf_counter()
+    if method == "legacy":
+        for format, output_path in outputs.items():
+            combined = AudioSegment.empty()
+            for path in paths:
+                combined += AudioSegment.from_file(path)
+            combined.export(output_path, format=format)
+    else:
+        stitch_audio(paths, outputs)
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    print(f"{elapsed:.3f} {peak_mb:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--methods", nargs="+", default=["legacy", "stitch"])
+    parser.add_argument("--run", nargs=3, metavar=("METHOD", "CHUNK_DIR", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        method, chunk_dir, count = args.run
+        paths = [os.path.join(chunk_dir, f"chunk_{i}.wav") for i in range(int(count))]
+        with tempfile.TemporaryDirectory() as output_dir:
+            run_once(method, paths, output_dir)
+        return
+
+    print(f"{'chunks':>6} {'audio':>8} {'method':>8} {'seconds':>9} {'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        make_chunks(chunk_dir, max(args.chunks))
+        for count in args.chunks:
+            for method in args.methods:
+                result = subprocess.run(
+                    [sys.executable, __file__, "--run", method, chunk_dir, str(count)],
+                    capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                )
+                if result.returncode != 0:
+                    print(result.stderr, file=sys.stderr)
+                    continue
+                seconds, peak_mb = result.stdout.split()[-2:]
+                minutes = count * CHUNK_SECONDS / 60
+                print(f"{count:>6} {minutes:>6.1f}m {method:>8} {float(seconds):>9.2f} {float(peak_mb):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Benchmark for SAM page loads: time to a warm page and browser memory
+# against browser configuration.
+#
+#   python bench_browser.py                    # all configurations
+#   python bench_browser.py --pages 5          # pages opened per run
+#   python bench_browser.py --configs headless headless-blocked
+#
+# Every configuration runs in a fresh process with its own browser. Pages are
+# opened one after another in new contexts like the page pool does, so the
+# first page is cold and the rest show the effect of the shared static cache.
+
+CONFIGS = {
+    "headed": {"headless": False, "block_requests": False},
+    "headless": {"headless": True, "block_requests": False},
+    "headless-blocked": {"headless": True, "block_requests": True},
+}
+
+
+def browser_rss_mb() -> float:
+    # Resident memory of every process below this one (Playwright driver,
+    # browser, renderers)
+    rows = subprocess.run(["ps", "-eo", "pid=,ppid=,rss="], capture_output=True, text=True).stdout.split("\n")
+    children: dict[int, list[tuple[int, int]]] = {}
+    for row in rows:
+        if row.strip():
+            pid, ppid, rss = map(int, row.split())
+            children.setdefault(ppid, []).append((pid, rss))
+
+    total = 0
+    stack = [pid for pid, _ in children.get(os.getpid(), [])]
+    rss_by_pid = {pid: rss for entries in children.values() for pid, rss in entries}
+    while stack:
+        pid = stack.pop()
+        total += rss_by_pid.get(pid, 0)
+        stack.extend(child for child, _ in children.get(pid, []))
+    return total / 1024
+
+
+async def run_once(config: str, pages: int):
+    from app.browser import BrowserManager
+
+    # No pool: pages are opened here, not by the pool's warm-up
+    manager = BrowserManager(pool_size=0, **CONFIGS[config])
+    await manager.start()
+
+    load_ms = []
+    heap_mb = []
+    opened = []
+    try:
+        for _ in range(pages):
+            started = time.perf_counter()
+            pooled = await manager._open_page()
+            load_ms.append((time.perf_counter() - started) * 1000)
+            opened.append(pooled)
+
+            cdp = await pooled.context.new_cdp_session(pooled.page)
+            await cdp.send("Performance.enable")
+            metrics = {m["name"]: m["value"] for m in (await cdp.send("Performance.getMetrics"))["metrics"]}
+            heap_mb.append(metrics.get("JSHeapUsedSize", 0) / (1024 * 1024))
+
+        stats = manager.stats()
+        print(json.dumps({
+            "load_ms": load_ms,
+            "heap_mb": heap_mb,
+            "rss_mb": browser_rss_mb(),
+            "blocked": stats["blocked_requests"],
+            "static_hits": stats["static_hits"],
+        }))
+    finally:
+        for pooled in opened:
+            await pooled.context.close()
+        await manager.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--run", metavar="CONFIG", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        asyncio.run(run_once(args.run, args.pages))
+        return
+
+    print(f"{'config':>16} {'first ms':>9} {'warm ms':>9} {'heap MB':>8} {'RSS MB':>8} {'MB/page':>8} {'blocked':>8} {'hits':>6}")
+    for config in args.configs:
+        result = subprocess.run(
+            [sys.executable, __file__, "--run", config, "--pages", str(args.pages)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            continue
+        run = json.loads(result.stdout.strip().split("\n")[-1])
+        load_ms = run["load_ms"]
+        warm_ms = sum(load_ms[1:]) / (len(load_ms) - 1) if len(load_ms) > 1 else load_ms[0]
+        heap_mb = sum(run["heap_mb"]) / len(run["heap_mb"])
+        print(f"{config:>16} {load_ms[0]:>9.0f} {warm_ms:>9.0f} {heap_mb:>8.1f} {run['rss_mb']:>8.0f} "
+              f"{run['rss_mb'] / args.pages:>8.0f} {run['blocked']:>8} {run['static_hits']:>6}")
+
+
+if __name__ == "__main__":
+    main()
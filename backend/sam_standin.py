@@ -0,0 +1,92 @@
+"""Local stand-in for the SAM demo backend, for trying the http transport
+without hitting the real site:
+
+    python sam_standin.py --port 8100
+    SAMANTHA_SAM_BASE_URL=http://localhost:8100 SAMANTHA_SAM_TRANSPORT=http \
+        SAMANTHA_SAM_PROMPT_DOC_ID=1 python run.py
+
+It serves a page that makes a GraphQL request the way the real one does (so
+a session can be harvested), accepts uploads, reports them processing for
+one useSAMUploadMediaQuery poll, and answers prompts with the uploaded audio
+as both results.
+"""
+import argparse
+import json
+import secrets
+
+import uvicorn
+from fastapi import FastAPI, Form, HTTPException, Request, UploadFile
+from fastapi.responses import HTMLResponse, Response
+
+app = FastAPI()
+media: dict[str, tuple[bytes, str]] = {}
+polled: set[str] = set()
+LSD = secrets.token_urlsafe(16)
+
+PAGE = """<!doctype html>
+<html><body>
+<button onclick="this.remove()">Accept</button>
+<input type="file">
+<script>
+document.cookie = "datr=standin; path=/";
+fetch("/api/graphql/", {
+  method: "POST",
+  headers: {"content-type": "application/x-www-form-urlencoded", "x-fb-lsd": "%s"},
+  body: new URLSearchParams({lsd: "%s", av: "0", __user: "0", __a: "1",
+    fb_api_req_friendly_name: "StandinQuery", variables: "{}", doc_id: "0"}),
+});
+</script>
+</body></html>
+"""
+
+
+@app.get("/segment-anything/editor/segment-audio")
+def page():
+    return HTMLResponse(PAGE % (LSD, LSD))
+
+
+@app.post("/api/graphql/")
+async def graphql(
+    request: Request, lsd: str = Form(""), variables: str = Form("{}"),
+    fb_api_req_friendly_name: str = Form(""), file: UploadFile | None = None,
+):
+    if lsd != LSD or request.headers.get("x-fb-lsd") != LSD:
+        raise HTTPException(status_code=403, detail="bad session")
+
+    if file is not None:
+        media_id = str(secrets.randbelow(10 ** 15))
+        media[media_id] = (await file.read(), file.content_type or "audio/mpeg")
+        return Response(json.dumps({"data": {"media": {"id": media_id}}}) + "\n", media_type="application/x-ndjson")
+
+    if fb_api_req_friendly_name == "useSAMUploadMediaQuery":
+        media_id = json.loads(variables).get("id")
+        if media_id not in media:
+            status = "ERROR"
+        elif media_id in polled:
+            status = "COMPLETE"
+        else:
+            polled.add(media_id)
+            status = "PROCESSING"
+        return Response(json.dumps({"data": {"media": {"id": media_id, "status": status}}}) + "\n", media_type="application/x-ndjson")
+
+    media_id = json.loads(variables).get("media_id")
+    if media_id not in media:
+        return Response(json.dumps({"data": None}) + "\n", media_type="application/x-ndjson")
+    url = f"{request.base_url}standin-media/{media_id}"
+    result = {"isolated_url": url, "without_isolated_url": url}
+    return Response(json.dumps({"data": {"separation": result}}) + "\n", media_type="application/x-ndjson")
+
+
+@app.get("/standin-media/{media_id}")
+def standin_media(media_id: str):
+    if media_id not in media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    content, content_type = media[media_id]
+    return Response(content, media_type=content_type)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -10,6 +10,8 @@ interface Outputs {
   without_isolated: string;
   isolated_mp3: string;
   without_isolated_mp3: string;
+  isolated_peaks?: string;
+  without_isolated_peaks?: string;
 }
 
 function getUserId(): string {
@@ -20,6 +22,56 @@ function getUserId(): string {
   return id;
 }
 
+// Draws precomputed min/max peaks from /peaks instead of decoding the audio
+function Waveform({ src }: { src: string }) {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  const [peaks, setPeaks] = useState<Int16Array | null>(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    setPeaks(null);
+    fetch(src)
+      .then((res) => (res.ok ? res.arrayBuffer() : null))
+      .then((buffer) => {
+        if (buffer && !cancelled) setPeaks(new Int16Array(buffer));
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [src]);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas || !peaks) return;
+    const width = canvas.clientWidth * window.devicePixelRatio;
+    const height = canvas.clientHeight * window.devicePixelRatio;
+    canvas.width = width;
+    canvas.height = height;
+    const ctx = canvas.getContext("2d");
+    if (!ctx) return;
+    ctx.clearRect(0, 0, width, height);
+    ctx.fillStyle = "#9ca3af";
+    const count = peaks.length / 2;
+    for (let x = 0; x < width; x++) {
+      const start = Math.floor((x / width) * count);
+      const end = Math.max(start + 1, Math.floor(((x + 1) / width) * count));
+      let min = 0;
+      let max = 0;
+      for (let i = start; i < end && i < count; i++) {
+        min = Math.min(min, peaks[2 * i]);
+        max = Math.max(max, peaks[2 * i + 1]);
+      }
+      const top = ((1 - max / 32768) * height) / 2;
+      const bottom = ((1 - min / 32768) * height) / 2;
+      ctx.fillRect(x, top, 1, Math.max(1, bottom - top));
+    }
+  }, [peaks]);
+
+  if (!peaks) return null;
+  return <canvas ref={canvasRef} className="w-full h-16 mb-2" />;
+}
+
 interface LibraryOutput {
   id: string;
   prompt: string;
@@ -338,6 +390,7 @@ function UploadPage() {
                 </button>
               </div>
             </div>
+            {outputs.isolated_peaks && <Waveform src={`${API_URL}${outputs.isolated_peaks}`} />}
             <audio controls src={isolatedUrl} className="w-full h-14" />
           </div>
           
@@ -359,6 +412,7 @@ function UploadPage() {
                 </button>
               </div>
             </div>
+            {outputs.without_isolated_peaks && <Waveform src={`${API_URL}${outputs.without_isolated_peaks}`} />}
             <audio controls src={withoutIsolatedUrl} className="w-full h-14" />
           </div>
         </div>
@@ -397,6 +451,7 @@ function UploadPage() {
         )}
         
         <div className="w-full max-w-2xl mb-4">
+          <Waveform src={`${API_URL}/peaks/${uploadId}`} />
           <audio controls src={uploadUrl} className="w-full h-14" />
         </div>
         